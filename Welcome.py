@@ -19,4 +19,10 @@ Gebe deine Tipps ein 🔥🔥
 Die derzeitigen Punkte.
 Punktezahl wächst im laufe des Turniers exponentiell.
 Beispiel im achtelfinale hat man eine 1/2 chance richtig zu raten --> 2p.
-Im finale hat man eine 1/16 chance richtig zu raten --> 16p.""")
\ No newline at end of file
+Im finale hat man eine 1/16 chance richtig zu raten --> 16p.""")
+
+# hidden admin view, only with ?admin=<admin_token from the secrets>
+admin_token = st.secrets.get("admin_token")
+if admin_token and st.experimental_get_query_params().get("admin", [None])[0] == admin_token:
+    from utilities import display_admin
+    display_admin()
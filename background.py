@@ -0,0 +1,46 @@
+import threading
+import traceback
+
+# Results too slow to compute while a page waits. Asking for a key that
+# isn't the latest one starts the computation on a background thread and
+# returns the last finished result in the meantime. Keys asked for while
+# one is running are coalesced, only the newest gets computed next.
+
+
+class Latest:
+
+    def __init__(self, compute, name="latest"):
+        # compute(key) runs on the background thread
+        self.compute = compute
+        self.name = name
+        self.key = None
+        self.result = None
+        self.pending = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get(self, key):
+        # (result, key it was computed for), (None, None) before the first
+        with self._lock:
+            if key != self.key:
+                self.pending = key
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+            return self.result, self.key
+
+    def _run(self):
+        while True:
+            with self._lock:
+                key = self.pending
+                self.pending = None
+                if key is None or key == self.key:
+                    self._thread = None
+                    return
+            try:
+                result = self.compute(key)
+            except Exception:
+                traceback.print_exc()
+                continue
+            with self._lock:
+                self.result, self.key = result, key
@@ -0,0 +1,54 @@
+import argparse
+import time
+import numpy as np
+from schedule import build_schedule
+from player_record import record_from_player
+from simulate import exact_chances
+from elimination import analyze, required_results
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_elimination --players 100 500 --decided 0
+# python -m benchmarks.bench_elimination --players 500 --decided 16 --time-limit 30
+# Also times required_results for a few players who can still win, the
+# way the leaderboard asks for them.
+
+
+def bench(count, decided, seed, time_limit):
+    live = synthetic.live_data(decided=decided, num_matches=63, seed=seed)
+    schedule = build_schedule(live)
+    records = [record_from_player(player["name"], player) for player in synthetic.players(live, count, seed=seed).values()]
+    start = time.perf_counter()
+    result = analyze(schedule, records, time_limit=time_limit)
+    elapsed = time.perf_counter() - start
+    print(f"{count:>6} players  64 teams  {decided:>2} decided  {result['alive'].sum():>6} can still win"
+          f"  {result['undecided'].sum():>4} undecided  {result['nodes']:>6} nodes  {elapsed:7.2f}s")
+    for name in [name for name, alive in zip(result["names"], result["alive"]) if alive][:3]:
+        start = time.perf_counter()
+        required = required_results(schedule, records, name, result["witness"][name], time_limit=time_limit)
+        print(f"        {name}  needs {'undecided' if required is None else len(required)}"
+              f"  {time.perf_counter() - start:7.2f}s")
+
+def accuracy():
+    # small brackets can be enumerated, who can still finish first has to
+    # be exactly who wins at least one outcome
+    for decided, count, seed in [(0, 200, 3), (6, 300, 4), (9, 100, 5)]:
+        live = synthetic.live_data(decided=decided, num_matches=15, seed=seed)
+        schedule = build_schedule(live)
+        records = [record_from_player(player["name"], player) for player in synthetic.players(live, count, seed=seed).values()]
+        exact = exact_chances(schedule, records)
+        result = analyze(schedule, records)
+        assert not result["undecided"].any()
+        assert np.array_equal(result["alive"], exact["first"] > 0)
+        assert np.array_equal(result["max_points"], exact["max_points"])
+    print("small brackets  same as exact enumeration")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, nargs="+", default=[30, 100, 500])
+    parser.add_argument("--decided", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--time-limit", type=float, default=None)
+    args = parser.parse_args()
+    accuracy()
+    for count in args.players:
+        bench(count, args.decided, args.seed, args.time_limit)
@@ -0,0 +1,83 @@
+import argparse
+import os
+import tempfile
+import time
+from schedule import build_schedule
+from player_store import open_store
+from leaderboard import refresh_leaderboard, score_rows
+from history import History, encode, ranked, result_state
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_history --players 1000 10000 --matches 31
+# A tournament played match by match with the standings history recorded
+# after every result. Reports the size of the log against a full snapshot
+# per result and the time for "standings after match N" from the history
+# against rescoring everybody from scratch, which it has to agree with.
+
+
+def rescored(records, schedule):
+    totals = {}
+    for name, match, bracket, goals, version in score_rows(list(records), list(records.values()), [1] * len(records), schedule):
+        old = totals.get(name, (0.0, 0.0))
+        totals[name] = (old[0] + bracket, old[1] + goals)
+    return ranked(totals)
+
+def bench(count, matches, url, page_start=50, page_size=50):
+    live = synthetic.live_data(decided=matches, num_matches=matches)
+    records = synthetic.records(live, count)
+    store = open_store(url)
+    store.put_many(records)
+    history = History()
+    schedules = []
+    full = 0
+    for decided in range(matches + 1):
+        schedule = build_schedule(synthetic.live_data(decided=decided, num_matches=matches))
+        schedules.append(schedule)
+        refresh_leaderboard(store, schedule)
+        history.record(store, schedule)
+        full += len(encode((0.0, True, result_state(schedule), {name: (bracket, goals) for name, bracket, goals in store.leaderboard()}, 0)))
+    logged = sum(len(data) for _, data in store.history())
+
+    # another process reading the log from the store sees the same standings
+    start = time.perf_counter()
+    reader = History()
+    reader.sync(store)
+    load = time.perf_counter() - start
+    assert reader.standings() == history.standings()
+
+    start = time.perf_counter()
+    from_history = [reader.standings_after_match(m) for m in range(matches)]
+    query = (time.perf_counter() - start) / matches
+    # the leaderboard page only asks for the places it shows
+    start = time.perf_counter()
+    paged = [reader.standings_after_match(m, page_start, page_size) for m in range(matches)]
+    page_query = (time.perf_counter() - start) / matches
+    for a, b in zip(paged, from_history):
+        assert a == b[page_start:page_start + page_size]
+    start = time.perf_counter()
+    from_scratch = [rescored(records, schedules[m + 1]) for m in range(matches)]
+    rescore = (time.perf_counter() - start) / matches
+    for m, (a, b) in enumerate(zip(from_history, from_scratch)):
+        assert [row[:3] for row in a] == [row[:3] for row in b], m
+
+    start = time.perf_counter()
+    movement = reader.rank_history(list(records)[:10])
+    chart = time.perf_counter() - start
+    for seq in range(1, len(reader) + 1):
+        ranks = {row[1]: row[0] for row in reader.standings(seq)}
+        for name, movement_ranks in movement.items():
+            assert movement_ranks[seq - 1] == (seq, movement_ranks[seq - 1][1], ranks.get(name)), (name, seq)
+    print(f"{count:>7} players  {len(reader)} entries  log {logged / 1024:8.1f}KB against {full / 1024:8.1f}KB of full snapshots"
+          f"  load {load * 1000:7.1f}ms  standings after match N {query * 1000:7.2f}ms, one page {page_query * 1000:7.2f}ms,"
+          f" rescored {rescore * 1000:8.1f}ms"
+          f"  rank history of 10 players {chart * 1000:6.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--matches", type=int, default=31)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.players:
+            bench(count, args.matches, "sqlite:///" + os.path.join(directory, f"players-{count}.db"))
+        bench(args.players[0], args.matches, "memory://")
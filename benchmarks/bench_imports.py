@@ -0,0 +1,50 @@
+import argparse
+import ast
+import json
+import subprocess
+import sys
+
+# python -m benchmarks.bench_imports
+# What a cold start pays for imports: everything utilities.py (and so
+# every page) imports apart from streamlit itself, in a fresh interpreter,
+# and which of the heavy libraries come along. Best of --runs.
+
+heavy = ["pandas", "numpy", "pyarrow"]
+script = """
+import json, sys, time
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+elapsed = time.perf_counter() - start
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+again = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "again": again, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def page_imports(path="utilities.py"):
+    modules = []
+    for node in ast.parse(open(path).read()).body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules.append(node.module)
+    return [m for m in dict.fromkeys(modules) if not m.startswith("streamlit")]
+
+def measure(modules, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", script.format(modules=modules, heavy=heavy)], capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output))
+    return min(results, key=lambda r: r["seconds"])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    modules = page_imports()
+    result = measure(modules, args.runs)
+    print(f"cold import of {len(modules)} modules {result['seconds'] * 1000:7.1f}ms  heavy libraries loaded: {', '.join(result['loaded']) or 'none'}")
+    print(f"importing them again, as every rerun does {result['again'] * 1000:7.3f}ms")
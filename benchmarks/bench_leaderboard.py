@@ -0,0 +1,98 @@
+import argparse
+import copy
+import os
+import random
+import tempfile
+import time
+from schedule import build_schedule
+from player_record import record_from_player
+from player_store import PlayerStore
+from leaderboard import refresh_leaderboard, score_rows, verify_leaderboard
+from live_feed import diff_live_data, event_matches
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_leaderboard --players 1000 10000
+# The materialized leaderboard through a whole tournament: every match
+# kicks off, then gets its result, and a few players submit new picks in
+# between. Kickoffs are rescored with the locked match like the kickoff
+# clock does, results with the matches the feed's events name and submits
+# like the submit queue. After every step the stored totals have to be
+# what scoring every player from scratch gives (verify_leaderboard). Also
+# times the incremental refreshes against rescoring and storing every
+# match of every player each time.
+
+
+def stage(final, decided):
+    # the sheet with only the first decided results of final in
+    live = copy.deepcopy(final)
+    first_round = (len(live) + 1) // 2
+    for m, match in live.items():
+        if m >= decided:
+            match.update(winner="NONE", goalsA=float("nan"), goalsB=float("nan"), done=False)
+        if m >= first_round:
+            fed = [c for c, feeder in live.items() if feeder["nextMatch"] == m]
+            for c in fed:
+                if c >= decided:
+                    match[final[c]["nextTeam"]] = "Not Decided"
+    return live
+
+def bench(count, num_matches, submits, seed=0):
+    final = synthetic.live_data(decided=num_matches, num_matches=num_matches, seed=seed)
+    rng = random.Random(seed)
+    live = stage(final, 0)
+    records = synthetic.records(live, count, seed=seed)
+    kickoffs = [schedule_match.kickoff for schedule_match in build_schedule(final)]
+    steps = 0
+    incremental_time = full_time = 0.0
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = PlayerStore(os.path.join(directory, "players.db"))
+        store.put_many(records)
+        schedule = build_schedule(live)
+        now = kickoffs[0] - 1800
+        refresh_leaderboard(store, schedule, now)
+        assert verify_leaderboard(store, schedule, now) == []
+
+        def step(matches):
+            # (incremental, full) seconds of one refresh
+            start = time.perf_counter()
+            refresh_leaderboard(store, schedule, now, matches)
+            incremental = time.perf_counter() - start
+            assert verify_leaderboard(store, schedule, now) == [], (sorted(matches), now)
+            start = time.perf_counter()
+            names, players, versions = zip(*store.iter_versioned())
+            store.put_scores(score_rows(names, players, versions, schedule, None, now))
+            return incremental, time.perf_counter() - start
+
+        for m in range(num_matches):
+            # a few players change their picks before the kickoff
+            changed = []
+            for _ in range(submits):
+                name = f"player{rng.randrange(count)}"
+                record = record_from_player(name, synthetic.random_player(live, name, rng))
+                changed.append((name, record, store.put(name, record)))
+            names, players, versions = zip(*changed)
+            store.put_scores(score_rows(names, players, versions, schedule, None, now))
+            assert verify_leaderboard(store, schedule, now) == []
+
+            now = kickoffs[m] + 1
+            times = [step({m})]
+            old, live = live, stage(final, m + 1)
+            schedule = build_schedule(live)
+            times.append(step(event_matches(diff_live_data(old, live))))
+            for incremental, full in times:
+                incremental_time += incremental
+                full_time += full
+                steps += 1
+
+    print(f"{count:>6} players  {num_matches:>2} matches  {int(steps)} refreshes agree with a full recompute"
+          f"  incremental {incremental_time / steps * 1000:8.1f}ms  rescoring everything {full_time / steps * 1000:8.1f}ms per refresh")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--matches", type=int, default=15)
+    parser.add_argument("--submits", type=int, default=5)
+    args = parser.parse_args()
+    for count in args.players:
+        bench(count, args.matches, args.submits)
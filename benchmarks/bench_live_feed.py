@@ -0,0 +1,128 @@
+import argparse
+import hashlib
+import http.server
+import io
+import threading
+import time
+import pandas as pd
+from live_feed import LiveFeed, fetch_csv, ConnectionPool, event_matches
+from schedule import build_schedule, goals_text
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_live_feed --delay 0.2
+# The live feed against a local HTTP server standing in for the sheet: a
+# bracket tab without goals, a goal feed tab with the results, a tab that is
+# slower than its timeout and one that always fails. Every tab takes delay
+# seconds to answer. The merged schedule has to match the synthetic one,
+# the slow and failing tabs must not hold up the rest, and connections are
+# reused. A result coming in afterwards has to name just its match.
+
+
+def csv_bytes(rows):
+    buffer = io.StringIO()
+    pd.DataFrame(rows).to_csv(buffer, index=False)
+    return buffer.getvalue().encode()
+
+def tabs(decided):
+    live = synthetic.live_data(decided=decided)
+    bracket = [dict(row, goalsA=float("nan"), goalsB=float("nan")) for row in live.values()]
+    goals = [{"match": m, "goalsA": row["goalsA"], "goalsB": row["goalsB"]} for m, row in live.items() if row["done"]]
+    return live, {"/bracket": csv_bytes(bracket), "/goals": csv_bytes(goals), "/slow": csv_bytes(goals)}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.delay * (20 if self.path == "/slow" else 1))
+        body = self.server.tabs.get(self.path)
+        if body is None:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class Server(http.server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # the feed hangs up on the slow tab once its timeout is over
+        pass
+
+def serve(tabs, delay):
+    server = Server(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.tabs, server.delay = tabs, delay
+    server.connections = server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def bench(delay, refreshes):
+    live, served = tabs(decided=8)
+    server = serve(served, delay)
+    base = f"http://127.0.0.1:{server.server_port}"
+    urls = {"bracket": base + "/bracket", "goals": base + "/goals", "slow": base + "/slow", "broken": base + "/broken"}
+
+    # one after the other, a fresh connection each, like the old load_data
+    start = time.perf_counter()
+    for name, url in urls.items():
+        try:
+            fetch_csv(url, timeout=delay * 40, pool=ConnectionPool())
+        except IOError:
+            pass
+    sequential = time.perf_counter() - start
+
+    feed = LiveFeed(urls, timeout=delay * 5)
+    for source in feed.sources:
+        source.retries, source.backoff = 1, delay / 4
+    server.connections = server.requests = 0
+    times = []
+    for _ in range(refreshes):
+        start = time.perf_counter()
+        feed.refresh()
+        times.append(time.perf_counter() - start)
+
+    expected = build_schedule(live)
+    results = lambda schedule: [(m.winner, goals_text(m.goals_a), goals_text(m.goals_b), m.done) for m in schedule]
+    assert results(feed.schedule) == results(expected)
+    broken = next(source for source in feed.sources if source.name == "broken")
+    assert broken.is_open(time.time()), broken.failures
+    assert server.connections < server.requests
+
+    # the next undecided match gets a result on the goals tab
+    before = feed.schedule
+    match = next(m for m, row in live.items() if not row["done"])
+    goals = [{"match": m, "goalsA": row["goalsA"], "goalsB": row["goalsB"]} for m, row in live.items() if row["done"]]
+    server.tabs["/goals"] = csv_bytes(goals + [{"match": match, "goalsA": 3.0, "goalsB": 1.0}])
+    assert feed.refresh()
+    assert event_matches(feed.events) == {match}, feed.events
+    assert feed.changed_since(before) == {match}
+    assert feed.changed_since(feed.schedule) == set()
+    print(f"delay {delay}s  sequential {sequential:6.2f}s  concurrent first {times[0]:6.2f}s"
+          f"  later {min(times[1:]):6.2f}s  {server.requests} requests on {server.connections} connections"
+          f"  broken source open after {broken.failures} failures")
+    server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--refreshes", type=int, default=4)
+    args = parser.parse_args()
+    bench(args.delay, args.refreshes)
@@ -0,0 +1,65 @@
+import argparse
+import copy
+import random
+import time
+from schedule import build_schedule
+from player_record import player_from_record, record_from_player
+from picks import apply_choice, propagate_picks
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_picks --sequences 3000
+# Random sequences of pick edits, the way the selectboxes make them, on
+# synthetic players. Every edit goes through apply_choice on one copy of the
+# matches and through the full propagate_picks on another, which have to
+# end up the same, and every match apply_choice changed has to be in the
+# dirty set it returned. Also times both.
+
+
+def edit_sequence(matches, bracket, rng, edits):
+    incremental = copy.deepcopy(matches)
+    full = copy.deepcopy(matches)
+    incremental_time = full_time = 0.0
+    for _ in range(edits):
+        index = rng.randrange(bracket.num_matches)
+        match = incremental[index]
+        choice = rng.choice(["Not Decided", match["TeamA"], match["TeamB"]])
+        before = copy.deepcopy(incremental)
+
+        start = time.perf_counter()
+        dirty = apply_choice(incremental, bracket, index, choice)
+        incremental_time += time.perf_counter() - start
+        start = time.perf_counter()
+        full[index]["prediction"] = choice
+        propagate_picks(full, bracket)
+        full_time += time.perf_counter() - start
+
+        assert incremental == full, (index, choice)
+        changed = {key for key in incremental if incremental[key] != before[key]}
+        assert changed <= dirty, (index, choice, changed - dirty)
+    return incremental_time, full_time
+
+def bench(sequences, edits, num_matches):
+    live = synthetic.live_data(decided=0, num_matches=num_matches)
+    schedule = build_schedule(live)
+    rng = random.Random(0)
+    players = list(synthetic.players(live, min(sequences, 200)).values())
+    incremental_time = full_time = 0.0
+    for i in range(sequences):
+        player = players[i % len(players)]
+        matches = player_from_record(record_from_player(player["name"], player), schedule)["matches"]
+        propagate_picks(matches, schedule.bracket)
+        a, b = edit_sequence(matches, schedule.bracket, rng, edits)
+        incremental_time += a
+        full_time += b
+    count = sequences * edits
+    print(f"{num_matches:>4} matches  {sequences} sequences x {edits} edits agree"
+          f"  apply_choice {incremental_time / count * 1e6:7.1f}us  propagate_picks {full_time / count * 1e6:7.1f}us per edit")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sequences", type=int, default=3000)
+    parser.add_argument("--edits", type=int, default=20)
+    parser.add_argument("--matches", type=int, nargs="+", default=[15, 31, 63])
+    args = parser.parse_args()
+    for num_matches in args.matches:
+        bench(args.sequences, args.edits, num_matches)
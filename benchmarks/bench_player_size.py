@@ -0,0 +1,28 @@
+import argparse
+import pickle as pkl
+from pympler import asizeof
+from player_record import record_from_player
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_player_size
+# Memory and stored size per player, old pickled dicts against PlayerRecords.
+
+
+def bench(count):
+    live = synthetic.live_data(decided=8)
+    players = synthetic.players(live, count)
+    records = {name: record_from_player(name, player) for name, player in players.items()}
+
+    dict_memory = asizeof.asizeof(players) / count
+    record_memory = asizeof.asizeof(records) / count
+    dict_disk = sum(len(pkl.dumps(player)) for player in players.values()) / count
+    record_disk = sum(len(record.to_bytes()) for record in records.values()) / count
+    print(f"{count:>7} players  memory {dict_memory:8.0f}B -> {record_memory:6.0f}B per player"
+          f"  stored {dict_disk:6.0f}B -> {record_disk:4.0f}B per player")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, nargs="+", default=[1_000])
+    args = parser.parse_args()
+    for count in args.players:
+        bench(count)
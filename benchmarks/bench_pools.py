@@ -0,0 +1,66 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy as np
+from schedule import build_schedule
+from player_record import record_from_player
+from player_store import open_store
+from leaderboard import score_rows
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_pools --writers 4
+# A big pool rewriting its players in large batches from several processes
+# while a small pool's players submit one at a time. Once with both pools
+# in one SQLite file, like a single store with the pool in the player name,
+# and once with every pool in its own shard. Latencies are the small pool's.
+
+
+def big_pool(url, pool, ready, stop, live, batch):
+    store = open_store(url, pool)
+    schedule = build_schedule(live)
+    records = [record_from_player(f"big-{name}", player) for name, player in synthetic.players(live, batch).items()]
+    ready.wait()
+    while not stop.is_set():
+        results = store.write_batch([(record.name, lambda _, record=record: record, record, None) for record in records])
+        store.put_scores(score_rows([r.name for r in records], records, [version for _, version in results], schedule))
+
+def small_pool(store, live, submits):
+    schedule = build_schedule(live)
+    latencies = []
+    for name, player in synthetic.players(live, submits, seed=1).items():
+        record = record_from_player(f"small-{name}", player)
+        start = time.perf_counter()
+        results = store.write_batch([(record.name, lambda _: record, record, 0)])
+        store.put_scores(score_rows([record.name], [record], [results[0][1]], schedule))
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+def bench(writers, batch, submits):
+    live = synthetic.live_data(decided=4)
+    for label, big, small in (("one file", None, None), ("sharded", "big", "small")):
+        with tempfile.TemporaryDirectory() as directory:
+            url = "sqlite:///" + os.path.join(directory, "players.db")
+            store = open_store(url, small)
+            ready, stop = multiprocessing.Barrier(writers + 1), multiprocessing.Event()
+            processes = [multiprocessing.Process(target=big_pool, args=(url, big, ready, stop, live, batch)) for _ in range(writers)]
+            for p in processes:
+                p.start()
+            ready.wait()
+            time.sleep(0.5)
+            latencies = small_pool(store, live, submits)
+            stop.set()
+            for p in processes:
+                p.join()
+            assert len(store.leaderboard()) >= submits
+            print(f"{label:>9}  {writers} big pool writers x {batch} players  small pool submit"
+                  f"  p50 {np.percentile(latencies, 50) * 1000:7.1f}ms  p99 {np.percentile(latencies, 99) * 1000:7.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=2000)
+    parser.add_argument("--submits", type=int, default=200)
+    args = parser.parse_args()
+    bench(args.writers, args.batch, args.submits)
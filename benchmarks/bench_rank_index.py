@@ -0,0 +1,73 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from leaderboard import RankIndex
+from player_store import PlayerStore
+from redis_store import LocalRedis, RedisPlayerStore
+
+# python -m benchmarks.bench_rank_index --players 50000
+# A leaderboard page, a rank and a name search from the rank index against
+# sorting every player like the page used to, after a round of score
+# changes. The index has to agree with the sort everywhere.
+
+
+def score_rows(names, rng):
+    # one match per player is enough to give them a total
+    return [(name, 0, float(rng.randint(0, 40)), float(rng.randint(0, 20)), 1) for name in names]
+
+def sorted_rows(store):
+    rows = sorted(store.leaderboard_changes()[0], key=lambda row: (-row[1], row[0]))
+    ahead = {}
+    ranked = []
+    for i, (name, bracket, goals) in enumerate(rows):
+        ahead.setdefault(bracket, i)
+        ranked.append((ahead[bracket] + 1, name, bracket, goals))
+    return ranked
+
+def check(store, ranks, rng):
+    expected = sorted_rows(store)
+    assert ranks.page(0, len(expected)) == expected
+    for rank, name, _, _ in rng.sample(expected, min(50, len(expected))):
+        assert ranks.rank(name) == rank
+    prefix = expected[0][1][:3]
+    assert ranks.search(prefix, limit=len(expected)) == sorted(row[1] for row in expected if row[1].startswith(prefix))
+
+def bench(store, label, count, seed=0):
+    rng = random.Random(seed)
+    names = [f"player{i:06d}" for i in range(count)]
+    store.put_scores(score_rows(names, rng))
+    ranks = RankIndex()
+    start = time.perf_counter()
+    ranks.sync(store)
+    build = time.perf_counter() - start
+    check(store, ranks, rng)
+
+    # a result comes in and a tenth of the players move
+    store.put_scores(score_rows(rng.sample(names, count // 10), rng))
+    start = time.perf_counter()
+    changed = ranks.sync(store)
+    sync = time.perf_counter() - start
+    check(store, ranks, rng)
+
+    start = time.perf_counter()
+    sorted_rows(store)[:50]
+    full_sort = time.perf_counter() - start
+    start = time.perf_counter()
+    for name in rng.sample(names, 100):
+        ranks.page(ranks.position(name), 50)
+        ranks.around(name)
+        ranks.search(name[:9])
+    lookup = (time.perf_counter() - start) / 100
+    print(f"{label:>7} {count:>7} players  build {build:6.2f}s  sync {changed} changes {sync:6.3f}s"
+          f"  page+around+search {lookup * 1000:6.3f}ms  full sort {full_sort * 1000:7.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, nargs="+", default=[1000, 50000])
+    args = parser.parse_args()
+    for count in args.players:
+        with tempfile.TemporaryDirectory() as directory:
+            bench(PlayerStore(os.path.join(directory, "players.db")), "sqlite", count)
+        bench(RedisPlayerStore(LocalRedis()), "redis", count)
@@ -0,0 +1,46 @@
+import argparse
+import time
+from scoring import calculate_points
+from schedule import build_schedule
+from player_record import record_from_player
+from vector_scoring import encode_live, encode_players, score_players
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_scoring --players 10000 100000
+
+
+def bench(count, python_limit):
+    live = synthetic.live_data(decided=10)
+    schedule = build_schedule(live)
+    players = list(synthetic.players(live, count).values())
+    now = time.time()
+
+    records = [record_from_player(player["name"], player) for player in players]
+    start = time.perf_counter()
+    encoded = encode_players(records)
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    bracket, goals = score_players(encoded, encode_live(schedule, now), schedule.bracket)
+    bracket_totals, goal_totals = bracket.sum(axis=1), goals.sum(axis=1)
+    score_time = time.perf_counter() - start
+
+    # the dict based scoring is slow, so only a prefix of the players is
+    # timed and checked against the array totals
+    checked = players[:python_limit]
+    start = time.perf_counter()
+    expected = [calculate_points(player, schedule, now) for player in checked]
+    python_time = (time.perf_counter() - start) * count / max(len(checked), 1)
+    for i, (points, _, match_points) in enumerate(expected):
+        assert bracket_totals[i] == points and goal_totals[i] == match_points, i
+
+    print(f"{count:>7} players  calculate_points {python_time:8.3f}s"
+          f"{' (extrapolated)' if len(checked) < count else ''}"
+          f"  encode {encode_time:7.3f}s  vectorized {score_time:7.4f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--python-limit", type=int, default=20_000)
+    args = parser.parse_args()
+    for count in args.players:
+        bench(count, args.python_limit)
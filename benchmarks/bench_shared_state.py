@@ -0,0 +1,100 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from schedule import build_schedule
+from player_record import PlayerRecord, record_from_player
+from player_store import VersionConflict, open_store
+from leaderboard import refresh_leaderboard, verify_leaderboard
+from redis_store import LocalRedis, RedisPlayerStore
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_shared_state --workers 8 --updates 50
+# Several app workers bumping the goals of one shared player at once, every
+# update has to land. Once through update, like match goal submits, and
+# once as bracket submits: read the versioned player, write it back only if
+# nobody stored it since, and on a VersionConflict reload and submit again.
+# SQLite runs in separate processes, the Redis store against the in-process
+# stand-in from threads.
+
+
+def bump(record):
+    record.goals_a[0] += 1
+    return record
+
+def submit(store, default):
+    # conflicts lost to another worker
+    conflicts = 0
+    while True:
+        record, version = store.get_versioned("shared")
+        if record is None:
+            record = PlayerRecord.from_bytes("shared", default.to_bytes())
+        try:
+            store.put("shared", bump(record), expected_version=version)
+            return conflicts
+        except VersionConflict:
+            conflicts += 1
+
+def worker(store, mode, updates, default, conflicts=None):
+    lost = 0
+    for _ in range(updates):
+        if mode == "update":
+            store.update("shared", bump, default=default)
+        else:
+            lost += submit(store, default)
+    if conflicts is not None:
+        conflicts.put(lost)
+
+def process_worker(url, mode, updates, default, conflicts):
+    worker(open_store(url), mode, updates, default, conflicts)
+
+def check(store, label, workers, updates, elapsed, live, default, conflicts):
+    expected = default.goals_a[0] + workers * updates
+    assert store.get("shared").goals_a[0] == expected, (store.get("shared").goals_a[0], expected)
+    # the leaderboard scored by one worker is what every other one reads
+    refresh_leaderboard(store, build_schedule(live))
+    assert verify_leaderboard(store, build_schedule(live)) == []
+    print(f"{label:>15}  {workers} workers x {updates} updates  {workers * updates / elapsed:8.0f} updates/s"
+          f"  {conflicts} conflicts resubmitted  none lost")
+
+def bench(workers, updates, mode):
+    live = synthetic.live_data(decided=8)
+    players = {name: record_from_player(name, player) for name, player in synthetic.players(live, 100).items()}
+    default = next(iter(players.values()))
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = "sqlite:///" + os.path.join(directory, "players.db")
+        store = open_store(url)
+        store.put_many(players)
+        conflicts = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=process_worker, args=(url, mode, updates, default, conflicts)) for _ in range(workers)]
+        start = time.perf_counter()
+        for p in processes:
+            p.start()
+        lost = sum(conflicts.get(timeout=300) for _ in processes)
+        for p in processes:
+            p.join()
+        check(store, f"sqlite {mode}", workers, updates, time.perf_counter() - start, live, default, lost)
+
+    store = RedisPlayerStore(LocalRedis())
+    store.put_many(players)
+    conflicts = multiprocessing.Queue()
+    threads = [threading.Thread(target=worker, args=(store, mode, updates, default, conflicts)) for _ in range(workers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    lost = sum(conflicts.get() for _ in threads)
+    check(store, f"redis {mode}", workers, updates, time.perf_counter() - start, live, default, lost)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--updates", type=int, default=50)
+    parser.add_argument("--modes", nargs="+", default=["update", "submit"], choices=["update", "submit"])
+    args = parser.parse_args()
+    for mode in args.modes:
+        bench(args.workers, args.updates, mode)
@@ -0,0 +1,46 @@
+import argparse
+import time
+import numpy as np
+from schedule import build_schedule
+from player_record import record_from_player
+from simulate import exact_chances, simulate
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_simulate --players 2000 --simulations 100000
+
+
+def bench(count, simulations, decided, with_match_points):
+    live = synthetic.live_data(decided=decided)
+    schedule = build_schedule(live)
+    records = [record_from_player(player["name"], player) for player in synthetic.players(live, count).values()]
+    start = time.perf_counter()
+    result = simulate(schedule, records, simulations, with_match_points=with_match_points, seed=0)
+    elapsed = time.perf_counter() - start
+    print(f"{count:>6} players  {simulations} simulations  {decided:>2} decided"
+          f"  {'with' if with_match_points else 'without'} match points  {elapsed:7.2f}s")
+    return result
+
+def accuracy(simulations):
+    # a small bracket can be enumerated, the sampled chances have to agree
+    # with the exact ones up to sampling noise
+    live = synthetic.live_data(decided=0, num_matches=7, seed=1)
+    schedule = build_schedule(live)
+    records = [record_from_player(player["name"], player) for player in synthetic.players(live, 50, seed=1).values()]
+    exact = exact_chances(schedule, records)
+    sampled = simulate(schedule, records, simulations, seed=0)
+    error = max(np.abs(exact["first"] - sampled["first"]).max(), np.abs(exact["top3"] - sampled["top3"]).max())
+    tolerance = 5 / np.sqrt(simulations)
+    assert error < tolerance, (error, tolerance)
+    assert np.array_equal(exact["max_points"], sampled["max_points"])
+    print(f"small bracket  largest difference to exact enumeration {error:.4f} (tolerance {tolerance:.4f})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--simulations", type=int, default=100_000)
+    parser.add_argument("--decided", type=int, default=0)
+    args = parser.parse_args()
+    accuracy(args.simulations)
+    for count in args.players:
+        bench(count, args.simulations, args.decided, False)
+        bench(count, args.simulations, args.decided, True)
@@ -0,0 +1,53 @@
+import argparse
+import time
+from datetime import datetime
+import iso8601
+from dateutil import tz
+from scoring import update_player
+from schedule import build_schedule
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_status --players 10000
+# Compares the status pass on the parsed schedule with the old one that
+# parsed every kickoff and read the clock once per match.
+
+
+def legacy_update_player(player, live_data):
+    local_tz = tz.tzlocal()
+    for match, live_match in zip(player["matches"].values(), live_data.values()):
+        winner = live_match["winner"]
+        started = iso8601.parse_date(live_match["datetime"]) < datetime.now(local_tz)
+        if started and match["prediction"] == "Not Decided":
+            match["status"] = "NOT_VOTED"
+        elif winner != "NONE":
+            match["status"] = "CORRECT" if winner == match["prediction"] else "INCORRECT"
+        else:
+            match["status"] = "EMPTY"
+
+def bench(count):
+    live = synthetic.live_data(decided=10)
+    players = list(synthetic.players(live, count).values())
+
+    start = time.perf_counter()
+    for player in players:
+        legacy_update_player(player, live)
+    legacy = [[m["status"] for m in player["matches"].values()] for player in players]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    schedule = build_schedule(live)
+    now = time.time()
+    for player in players:
+        update_player(player, schedule, now)
+    schedule_time = time.perf_counter() - start
+    assert legacy == [[m["status"] for m in player["matches"].values()] for player in players]
+
+    print(f"{count:>7} players  per match parsing {legacy_time / count * 1e6:7.1f}us/player"
+          f"  parsed schedule {schedule_time / count * 1e6:6.1f}us/player")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, nargs="+", default=[1_000, 10_000])
+    args = parser.parse_args()
+    for count in args.players:
+        bench(count)
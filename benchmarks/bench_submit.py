@@ -0,0 +1,77 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+from schedule import build_schedule
+from player_record import record_from_player
+from player_store import PlayerStore
+from leaderboard import score_rows
+from write_queue import SubmitQueue
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_submit --submitters 1000
+# Everybody submits their bracket at once, each from its own thread like
+# Streamlit sessions. Every submit writes a new player and scores it, once
+# with a transaction per submit and once through the group committing
+# SubmitQueue, latencies are from the click to the submit being on disk.
+
+
+def run(submitters, records, submit):
+    barrier = threading.Barrier(submitters + 1)
+    latencies = [0.0] * submitters
+
+    def submitter(i):
+        barrier.wait()
+        start = time.perf_counter()
+        submit(records[i])
+        latencies[i] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=submitter, args=(i,)) for i in range(submitters)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return np.array(latencies), time.perf_counter() - start
+
+def report(label, latencies, elapsed):
+    print(f"{label:>12}  {len(latencies)} submitters  p50 {np.percentile(latencies, 50) * 1000:7.1f}ms"
+          f"  p99 {np.percentile(latencies, 99) * 1000:7.1f}ms  {len(latencies) / elapsed:7.0f} submits/s")
+
+def bench(submitters):
+    live = synthetic.live_data(decided=0)
+    schedule = build_schedule(live)
+    records = [record_from_player(name, player) for name, player in synthetic.players(live, submitters).items()]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = PlayerStore(os.path.join(directory, "players.db"))
+
+        def direct(record):
+            # what the submit callback did before, with a synced commit
+            conn = store._conn()
+            conn.execute("PRAGMA synchronous=FULL")
+            version = store.put(record.name, record, expected_version=0)
+            store.put_scores(score_rows([record.name], [record], [version], schedule))
+        report("per submit", *run(submitters, records, direct))
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = PlayerStore(os.path.join(directory, "players.db"))
+
+        def score(committed):
+            names, players, versions = zip(*committed)
+            store.put_scores(score_rows(names, players, versions, schedule))
+        submits = SubmitQueue(store, on_commit=score).start()
+        report("group commit", *run(submitters, records, lambda record: submits.put(record.name, record, expected_version=0).result()))
+        submits.stop()
+        assert len(store) == submitters and len(store.leaderboard()) == submitters
+        print(f"{'':>12}  {submits.batches} commits")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--submitters", type=int, nargs="+", default=[100, 1000])
+    args = parser.parse_args()
+    for count in args.submitters:
+        bench(count)
@@ -0,0 +1,59 @@
+import argparse
+import random
+import time
+import numpy as np
+import scoring
+import vector_scoring
+from schedule import build_schedule
+from benchmarks import synthetic
+
+# python -m benchmarks.bench_weights --players 1200
+# bracket_weights in scoring.py and vector_scoring.py against the recursive
+# calculate_bracket_points they replaced, kept below as it was, for every
+# match and the negative first round slots, on synthetic players at a few
+# stages of the 15 match tournament the old numbering was written for.
+# Players skip picks often so plenty of matches are NOT_VOTED.
+
+
+def recursive_bracket_points(player, match_number):
+    if match_number < 0 or player["matches"][match_number]["status"]=="NOT_VOTED":
+        return 1
+    next_l = 15 - ((15-match_number) * 2 + 1)
+    next_r = 15 - ((15-match_number) * 2)
+    res = recursive_bracket_points(player, next_l) + recursive_bracket_points(player, next_r)
+    return res
+
+def bench(count, decided, skip):
+    live = synthetic.live_data(decided=decided)
+    schedule = build_schedule(live)
+    rng = random.Random(decided)
+    players = [synthetic.random_player(live, f"player{i}", rng, skip=skip) for i in range(count)]
+    now = time.time()
+    for player in players:
+        scoring.update_player(player, schedule, now)
+
+    start = time.perf_counter()
+    expected = [[recursive_bracket_points(player, m) for m in range(len(schedule))] for player in players]
+    recursive_time = time.perf_counter() - start
+    start = time.perf_counter()
+    weights = [scoring.bracket_weights(player, schedule.bracket) for player in players]
+    memo_time = time.perf_counter() - start
+    not_voted = np.array([[match["status"] == "NOT_VOTED" for match in player["matches"].values()] for player in players])
+    vector = vector_scoring.bracket_weights(not_voted, schedule.bracket)
+
+    for i, player in enumerate(players):
+        assert list(weights[i]) == expected[i], i
+        assert list(vector[i]) == expected[i], i
+        for m in range(-2, len(schedule)):
+            assert scoring.calculate_bracket_points(player, schedule, m) == recursive_bracket_points(player, m), (i, m)
+    print(f"{count:>6} players  {decided:>2} decided  {int(not_voted.sum()):>5} NOT_VOTED matches  agree"
+          f"  recursive {recursive_time * 1000:7.1f}ms  bracket_weights {memo_time * 1000:7.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=1200)
+    parser.add_argument("--decided", type=int, nargs="+", default=[0, 5, 10, 15])
+    parser.add_argument("--skip", type=float, default=0.3)
+    args = parser.parse_args()
+    for decided in args.decided:
+        bench(args.players, decided, args.skip)
@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from schedule import build_schedule
+from player_store import PlayerStore
+from player_record import player_from_record
+from scoring import calculate_points
+from leaderboard import refresh_leaderboard
+from bracket_svg import bracket_layout, player_nodes, render_bracket
+from export import write_export
+from benchmarks import synthetic
+
+# python -m benchmarks.run --players 100 10000 100000 --output results.json
+# python -m benchmarks.run --compare results.json
+# Times the storage, scoring, rendering and export paths on synthetic pools
+# at a few tournament stages and writes one JSON record per measurement, so
+# two runs can be compared. Paths that are per player and slow in pure
+# Python run on a sample and are reported per player.
+
+
+def timed(function, *args, repeat=1):
+    # best of repeat, in seconds
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench(count, stage, directory, sample=1000, repeat=3, seed=0):
+    live = synthetic.live_data(decided=synthetic.stage_decided(stage), seed=seed)
+    schedule = build_schedule(live)
+    records = synthetic.records(live, count, seed=seed)
+    names = list(records)
+    now = time.time()
+    results = []
+
+    def record(path, seconds, per=1):
+        results.append({"path": path, "players": count, "stage": stage, "seconds": seconds, "per_item": seconds / per})
+
+    store = PlayerStore(os.path.join(directory, f"players-{count}-{stage}.db"))
+    record("storage.put_many", timed(store.put_many, records)[0], count)
+    # reads are timed best of repeat, writes, the refresh and the export
+    # change what the next run would do so they run once
+    record("storage.load_players", timed(lambda: [player_from_record(r, schedule) for _, r in store.iter()], repeat=repeat)[0], count)
+    picked = names[::max(1, count // sample)][:sample]
+    record("storage.get", timed(lambda: [store.get(name) for name in picked], repeat=repeat)[0], len(picked))
+
+    record("scoring.refresh_leaderboard", timed(refresh_leaderboard, store, schedule, now)[0], count)
+    players = [player_from_record(records[name], schedule) for name in picked]
+    record("scoring.calculate_points", timed(lambda: [calculate_points(p, schedule, now) for p in players], repeat=repeat)[0], len(players))
+
+    def render():
+        render_bracket.cache_clear()
+        return [render_bracket(player_nodes(p, schedule, True), bracket_layout(schedule.bracket)) for p in players]
+    record("rendering.render_bracket", timed(render, repeat=repeat)[0], len(players))
+
+    record("export.csv", timed(write_export, store, schedule, "csv", os.path.join(directory, "exports"), now)[0], count)
+    return results
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": sys.version.split()[0], "numpy": np.__version__,
+            "machine": platform.machine(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def compare(old, new, threshold):
+    # slower by more than threshold (a ratio) counts as a regression
+    before = {(r["path"], r["players"], r["stage"]): r["seconds"] for r in old["results"]}
+    regressions = 0
+    for r in new["results"]:
+        key = (r["path"], r["players"], r["stage"])
+        if key not in before:
+            continue
+        ratio = r["seconds"] / before[key] if before[key] > 0 else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{r['path']:<28} {r['players']:>7} {r['stage']:<8} {before[key]:9.4f}s -> {r['seconds']:9.4f}s  x{ratio:5.2f}{flag}")
+    return regressions
+
+def report(results):
+    for r in results:
+        print(f"{r['path']:<28} {r['players']:>7} {r['stage']:<8} {r['seconds']:9.4f}s  {r['per_item'] * 1e6:10.1f}us each")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--stages", nargs="+", default=["start", "last 4"])
+    parser.add_argument("--sample", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.players:
+            for stage in args.stages:
+                results += bench(count, stage, directory, args.sample, args.repeat)
+    run = {"environment": environment(), "results": results}
+    report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), run, args.threshold)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,95 @@
+import copy
+import random
+from datetime import datetime, timedelta, timezone
+from teams import team_id, team_names
+from player_record import record_from_player
+
+# Made up tournaments and players in the same shape as the live sheet and
+# the stored players, for benchmarks.
+
+
+def next_match(match_number, num_matches=15):
+    # inverse of the numbering in calculate_bracket_points
+    if match_number == num_matches - 1:
+        return 0
+    return num_matches - (num_matches - match_number) // 2
+
+def tournament_teams(count):
+    # the real teams first, made up ones once they run out
+    teams = team_names[1:count + 1]
+    for i in range(len(teams), count):
+        teams.append(f"Team {i + 1}")
+        team_id(teams[-1])
+    return teams
+
+def live_data(decided=8, num_matches=15, seed=0):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    teams = tournament_teams(num_matches + 1)
+    first_round = (num_matches + 1) // 2
+    live = {}
+    for m in range(num_matches):
+        kickoff = now + timedelta(hours=m - decided + (1 if m >= decided else 0))
+        live[m] = {
+            "TeamA": "Not Decided", "TeamB": "Not Decided", "winner": "NONE",
+            "goalsA": float("nan"), "goalsB": float("nan"), "done": False,
+            "datetime": kickoff.isoformat(),
+            "nextMatch": next_match(m, num_matches),
+            "nextTeam": "TeamA" if m % 2 == 0 else "TeamB",
+        }
+    for m in range(first_round):
+        live[m]["TeamA"] = teams[2 * m]
+        live[m]["TeamB"] = teams[2 * m + 1]
+    for m in range(decided):
+        match = live[m]
+        winner = rng.choice([match["TeamA"], match["TeamB"]])
+        goals_a, goals_b = rng.randint(0, 3), rng.randint(0, 3)
+        if winner == match["TeamA"] and goals_a <= goals_b:
+            goals_a = goals_b + 1
+        if winner == match["TeamB"] and goals_b <= goals_a:
+            goals_b = goals_a + 1
+        match.update(winner=winner, goalsA=goals_a, goalsB=goals_b, done=True)
+        if match["nextMatch"] != 0:
+            live[match["nextMatch"]][match["nextTeam"]] = winner
+    return live
+
+def random_player(live, name, rng, skip=0.05, goal_predictions=0.3):
+    player = {"name": name, "submitted": True, "matches": copy.deepcopy(live)}
+    matches = player["matches"]
+    first_round = (len(matches) + 1) // 2
+    for m, match in matches.items():
+        if m >= first_round:
+            match["TeamA"] = match["TeamB"] = "Not Decided"
+    for m, match in matches.items():
+        match["status"] = "EMPTY"
+        choice = "Not Decided"
+        if rng.random() > skip:
+            choice = rng.choice([match["TeamA"], match["TeamB"]])
+        match["prediction"] = choice
+        if match["nextMatch"] != 0:
+            matches[match["nextMatch"]][match["nextTeam"]] = choice
+        if rng.random() < goal_predictions:
+            match["submitted"] = True
+            match["goalsAp"] = rng.randint(0, 3)
+            match["goalsBp"] = rng.randint(0, 3)
+    return player
+
+def players(live, count, seed=0):
+    rng = random.Random(seed)
+    return {f"player{i}": random_player(live, f"player{i}", rng) for i in range(count)}
+
+def records(live, count, seed=0):
+    # PlayerRecords made one player at a time, for pools too big to hold
+    # as player dicts
+    rng = random.Random(seed)
+    return {f"player{i}": record_from_player(f"player{i}", random_player(live, f"player{i}", rng)) for i in range(count)}
+
+def stage_decided(stage, num_matches=15):
+    # matches decided at a stage of the tournament: "start", a knockout
+    # round by how many teams are left ("last 8", "last 4", "final") or "end"
+    if stage == "start":
+        return 0
+    if stage == "end":
+        return num_matches
+    teams = 2 if stage == "final" else int(stage.split()[-1])
+    return num_matches - (teams - 1)
@@ -0,0 +1,71 @@
+import math
+
+# Shape of the knockout tree, built once from the nextMatch/nextTeam columns
+# of the sheet. Works for any number of teams, including brackets with byes
+# where a match has only one feeding match. nextMatch 0 marks the final.
+
+slots = ("TeamA", "TeamB")
+
+
+class Bracket:
+    __slots__ = ("num_matches", "parent", "slot", "children", "depth", "num_rounds", "round", "rounds", "order", "ancestors", "descendants")
+
+    def __init__(self, next_matches, next_teams):
+        n = len(next_matches)
+        self.num_matches = n
+        # parent match and the slot (0 TeamA, 1 TeamB) the winner moves into, -1 for the final
+        self.parent = [-1] * n
+        self.slot = [-1] * n
+        children = [[-1, -1] for _ in range(n)]
+        for match_number, (next_match, next_team) in enumerate(zip(next_matches, next_teams)):
+            if is_next_match(next_match, match_number, n):
+                next_match = int(next_match)
+                slot = slots.index(next_team)
+                self.parent[match_number] = next_match
+                self.slot[match_number] = slot
+                children[next_match][slot] = match_number
+        # feeding matches per slot, -1 for a first round slot or a bye
+        self.children = tuple(tuple(c) for c in children)
+
+        self.depth = [0] * n
+        for match_number in range(n):
+            depth, parent = 0, self.parent[match_number]
+            while parent != -1:
+                depth += 1
+                parent = self.parent[parent]
+            self.depth[match_number] = depth
+        self.num_rounds = max(self.depth, default=-1) + 1
+        # round 0 is the first round, the final is the last one
+        self.round = [self.num_rounds - 1 - depth for depth in self.depth]
+        self.rounds = [[m for m in range(n) if self.round[m] == r] for r in range(self.num_rounds)]
+        # feeding matches always come before the match they feed into
+        self.order = tuple(m for matches in self.rounds for m in matches)
+
+        self.ancestors = []
+        for match_number in range(n):
+            path, parent = [], self.parent[match_number]
+            while parent != -1:
+                path.append(parent)
+                parent = self.parent[parent]
+            self.ancestors.append(tuple(path))
+        descendants = [[] for _ in range(n)]
+        for match_number in range(n):
+            for ancestor in self.ancestors[match_number]:
+                descendants[ancestor].append(match_number)
+        self.descendants = [tuple(d) for d in descendants]
+
+    def round_name(self, round_number):
+        from_final = self.num_rounds - 1 - round_number
+        if from_final == 0:
+            return "Final"
+        if from_final == 1:
+            return "Semifinal"
+        if from_final == 2:
+            return "Quarterfinal"
+        return f"Round of {2 ** (from_final + 1)}"
+
+
+def is_next_match(next_match, match_number, num_matches):
+    if next_match is None or (isinstance(next_match, float) and math.isnan(next_match)):
+        return False
+    return 0 < int(next_match) < num_matches and int(next_match) != match_number
@@ -0,0 +1,102 @@
+import functools
+from html import escape
+from schedule import goals_text
+from teams import team_code
+
+# Draws a bracket as an inline SVG on the server, replacing the Mermaid
+# graph that every browser had to fetch from a CDN and lay out itself.
+# Rendering is cached on the node contents, which only change with the
+# player's picks or the live results.
+
+green = "#90EE90"
+red = "#FF7377"
+grey = "#cfc9c4"
+blue = "#ECECFD"
+status_colors = {"CORRECT": green, "INCORRECT": red, "NOT_VOTED": grey, "EMPTY": blue}
+
+node_width = 150
+node_height = 44
+column_gap = 36
+row_gap = 8
+
+
+@functools.lru_cache(maxsize=16)
+def bracket_layout(bracket):
+    # (column, row, parent) of every match of schedule.bracket and the
+    # number of columns: column = round (first round left, final right),
+    # row = position in the tree so every match sits between the two
+    # matches feeding into it
+    rows = [0.0] * bracket.num_matches
+    next_row = [0]
+
+    def place(key):
+        children = [child for child in bracket.children[key] if child >= 0]
+        if not children:
+            rows[key] = float(next_row[0])
+            next_row[0] += 1
+            return
+        for child in children:
+            place(child)
+        rows[key] = sum(rows[child] for child in children) / len(children)
+
+    for key in range(bracket.num_matches):
+        if bracket.parent[key] == -1:
+            place(key)
+    return tuple(zip(bracket.round, rows, bracket.parent)), bracket.num_rounds
+
+def node_svg(x, y, node):
+    _, team_a, team_b, pick, info, color = node
+    names = []
+    for slot, team in ((1, team_a), (2, team_b)):
+        if pick == slot:
+            names.append(f'<tspan font-weight="bold" text-decoration="underline">{escape(team)}</tspan>')
+        else:
+            names.append(escape(team))
+    title_y = y + (17 if info else 27)
+    parts = [
+        f'<rect x="{x}" y="{y}" width="{node_width}" height="{node_height}" rx="6" fill="{color}" stroke="#8E72D4"/>',
+        f'<text x="{x + node_width / 2}" y="{title_y}" text-anchor="middle" font-size="13">{names[0]} vs {names[1]}</text>',
+    ]
+    if info:
+        parts.append(f'<text x="{x + node_width / 2}" y="{y + 35}" text-anchor="middle" font-size="11">{escape(info)}</text>')
+    return "".join(parts)
+
+@functools.lru_cache(maxsize=4096)
+def render_bracket(nodes, layout):
+    # nodes: tuple of (key, team a, team b, pick (0 none, 1 a, 2 b), info, color)
+    # layout: bracket_layout of the schedule's bracket
+    positions, columns = layout
+    rows = max(row for _, row, _ in positions) + 1
+    width = columns * node_width + (columns - 1) * column_gap
+    height = rows * node_height + (rows - 1) * row_gap
+    corner = [(column * (node_width + column_gap), row * (node_height + row_gap)) for column, row, _ in positions]
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif">']
+    for node in nodes:
+        key = node[0]
+        next_match = positions[key][2]
+        if next_match != -1:
+            x1, y1 = corner[key][0] + node_width, corner[key][1] + node_height / 2
+            x2, y2 = corner[next_match][0], corner[next_match][1] + node_height / 2
+            middle = (x1 + x2) / 2
+            parts.append(f'<path d="M{x1},{y1} H{middle} V{y2} H{x2}" fill="none" stroke="#8E72D4"/>')
+    for node in nodes:
+        parts.append(node_svg(*corner[node[0]], node))
+    parts.append("</svg>")
+    return "".join(parts), height
+
+def bracket_node(key, match, scheduled, show_teams=False):
+    pick = 0
+    if match["prediction"] == match["TeamA"]:
+        pick = 1
+    if match["prediction"] == match["TeamB"]:
+        pick = 2
+    info = team_code(scheduled.name_a) + " " + goals_text(scheduled.goals_a) + " : " + goals_text(scheduled.goals_b) + " " + team_code(scheduled.name_b)
+    if match["status"] == "EMPTY":
+        info = ""
+        if show_teams and (scheduled.team_a != 0 or scheduled.team_b != 0):
+            info = team_code(scheduled.name_a) + " : " + team_code(scheduled.name_b)
+    color = status_colors[match["status"]]
+    return (key, team_code(match["TeamA"]), team_code(match["TeamB"]), pick, info, color)
+
+def player_nodes(player, schedule, show_teams=False):
+    return tuple(bracket_node(key, match, schedule[key], show_teams) for key, match in player["matches"].items())
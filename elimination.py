@@ -0,0 +1,517 @@
+import time
+import numpy as np
+from simulate import final_weights
+from vector_scoring import bracket_weights, encode_players
+from instrumentation import instrumented
+
+# Who can still finish first on bracket points, decided exactly. Every
+# match is a list of rows, one per team that could win it. A dynamic
+# program over the bracket gives the best a player can do against each
+# rival in every subtree, which bounds a branch-and-bound search over the
+# winners from the final down. Ties for first count as first, like in the
+# simulation.
+
+# the most totals x columns one step of the frontier may hold, past that
+# the player is left undecided instead of allocating gigabytes
+frontier_cells = 1 << 22
+
+
+class Outcomes:
+    def __init__(self, schedule):
+        bracket = schedule.bracket
+        self.bracket = bracket
+        self.order = bracket.order
+        self.top_down = tuple(reversed(bracket.order))
+        self.roots = [m for m in bracket.order if bracket.parent[m] == -1]
+        # rows of a match below split[m] come from its TeamA side
+        self.teams = {}
+        self.split = {}
+        for m in bracket.order:
+            scheduled = schedule[m]
+            sides = []
+            for child, team in zip(bracket.children[m], (scheduled.team_a, scheduled.team_b)):
+                sides.append(self.teams[child] if child >= 0 else np.array([team]))
+            self.split[m] = len(sides[0])
+            self.teams[m] = np.concatenate(sides)
+        # settled matches can only go one way
+        self.masks = {}
+        self.open = []
+        for m in bracket.order:
+            mask = np.ones(len(self.teams[m]), dtype=bool)
+            winner = schedule[m].winner
+            if winner != -1 and (self.teams[m] == winner).any():
+                mask = self.teams[m] == winner
+            if winner == -1:
+                self.open.append(m)
+            self.masks[m] = mask
+
+    def values(self, players):
+        # per match, rows x players: the bracket points each player gets
+        # when that row wins
+        weights = bracket_weights(final_weights(players), self.bracket)
+        prediction = players["prediction"]
+        values = {}
+        for m in self.order:
+            hit = (prediction[:, m][None, :] == self.teams[m][:, None]) & (prediction[:, m] != 0)[None, :]
+            values[m] = np.where(hit, weights[:, m][None, :], 0.0)
+        return values
+
+    def fix(self, masks, m, row):
+        # the team of that row wins m and so every match on its way there
+        masks = dict(masks)
+        touched = []
+        while True:
+            mask = np.zeros(len(self.teams[m]), dtype=bool)
+            mask[row] = True
+            masks[m] = mask & masks[m]
+            touched.append(m)
+            side = 0 if row < self.split[m] else 1
+            child = self.bracket.children[m][side]
+            if child < 0:
+                return masks, touched
+            row = row if side == 0 else row - self.split[m]
+            m = child
+
+    def exclude(self, masks, m, row):
+        masks = dict(masks)
+        masks[m] = masks[m].copy()
+        masks[m][row] = False
+        return masks, [m]
+
+    def tables(self, values, masks, base=None, touched=()):
+        # best total per row and column over the subtree of every match,
+        # only the subtrees above touched matches are redone against base
+        if base is None:
+            redo = set(self.order)
+        else:
+            redo = set(touched)
+            for m in touched:
+                redo.update(self.bracket.ancestors[m])
+        tables = dict(base or {})
+        columns = next(iter(values.values())).shape[1]
+        leaf = np.zeros((1, columns))
+        for m in self.order:
+            if m not in redo:
+                continue
+            child_a, child_b = self.bracket.children[m]
+            a = tables[child_a] if child_a >= 0 else leaf
+            b = tables[child_b] if child_b >= 0 else leaf
+            table = np.concatenate([a + b.max(axis=0), b + a.max(axis=0)]) + values[m]
+            table[~masks[m]] = -np.inf
+            tables[m] = table
+        return tables
+
+    def bound(self, tables):
+        return sum(tables[m].max(axis=0) for m in self.roots)
+
+    def best_rows(self, tables):
+        # the row winning every match in the best outcome of each column
+        rows = {}
+        for m in self.top_down:
+            best = tables[m].argmax(axis=0)
+            parent = self.bracket.parent[m]
+            if parent == -1:
+                rows[m] = best
+                continue
+            split = self.split[parent]
+            if self.bracket.slot[m] == 0:
+                rows[m] = np.where(rows[parent] < split, rows[parent], best)
+            else:
+                rows[m] = np.where(rows[parent] >= split, rows[parent] - split, best)
+        return rows
+
+    def outside(self, values, masks, tables):
+        # best total per row and column over everything outside the subtree
+        # of every match, given that row wins it
+        columns = next(iter(values.values())).shape[1]
+        leaf = np.zeros((1, columns))
+        outside = {}
+        for m in self.roots:
+            others = [tables[r].max(axis=0) for r in self.roots if r != m]
+            outside[m] = np.where(masks[m][:, None], sum(others, np.zeros(columns)), -np.inf)
+        for m in self.top_down:
+            split = self.split[m]
+            through = outside[m] + values[m]
+            children = self.bracket.children[m]
+            for side, child in enumerate(children):
+                if child < 0:
+                    continue
+                other = tables[children[1 - side]] if children[1 - side] >= 0 else leaf
+                own_rows = slice(0, split) if side == 0 else slice(split, None)
+                other_rows = slice(split, None) if side == 0 else slice(0, split)
+                wins = through[own_rows] + other.max(axis=0)
+                loses = (through[other_rows] + other).max(axis=0)
+                outside[child] = np.where(masks[child][:, None], np.maximum(wins, loses), -np.inf)
+        return outside
+
+    def frontier(self, values, masks, beam=None, deadline=None):
+        # an outcome where no column of values ends up negative, as the row
+        # winning every match, or None. Bottom up, every subtree keeps per
+        # row only the totals that are not beaten in every column by
+        # another of its outcomes and that can still end up non-negative
+        # given the best of the rest of the bracket, so outcomes of a
+        # subtree that come to the same are followed once. Exact unless
+        # beam is given, then only that many totals with the most room to
+        # spare are kept per row and None proves nothing. Raises Undecided
+        # when a step would hold more than frontier_cells numbers or past
+        # deadline (time.monotonic()), if given.
+        tables = self.tables(values, masks)
+        if (self.bound(tables) < 0).any():
+            return None
+        outside = self.outside(values, masks, tables)
+        columns = next(iter(values.values())).shape[1]
+        leaf = [(np.zeros((1, columns)), None, None)]
+        front = {}
+        unions = {}
+        for m in self.order:
+            children = self.bracket.children[m]
+            sides = [front[c] if c >= 0 else leaf for c in children]
+            for c in children:
+                if c >= 0 and c not in unions:
+                    unions[c] = union(front[c], outside[c], beam, deadline)
+            side_unions = [unions[c] if c >= 0 else union(leaf) for c in children]
+            rows = []
+            for row in range(len(self.teams[m])):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise Undecided()
+                side = 0 if row < self.split[m] else 1
+                own = sides[side][row if side == 0 else row - self.split[m]][0]
+                other = side_unions[1 - side][0]
+                if not masks[m][row] or len(own) == 0 or len(other) == 0:
+                    rows.append((np.zeros((0, columns)), None, None))
+                    continue
+                if len(own) * len(other) * columns > frontier_cells:
+                    raise Undecided()
+                totals = (own[:, None, :] + other[None, :, :] + values[m][row]).reshape(-1, columns)
+                slack = (totals + outside[m][row]).min(axis=1)
+                keep = np.flatnonzero(slack >= 0)
+                if beam is not None:
+                    keep = keep[np.argsort(-slack[keep], kind="stable")[:4 * beam]]
+                keep = keep[pareto(totals[keep], deadline=deadline)]
+                if beam is not None:
+                    keep = keep[np.argsort(-slack[keep], kind="stable")[:beam]]
+                rows.append((totals[keep], keep // len(other), keep % len(other)))
+            front[m] = rows
+
+        # every root keeps its own rows, the others are free
+        result = {}
+        for root in self.roots:
+            vectors, row_of, index_of = union(front[root], outside[root], beam, deadline)
+            if len(vectors) == 0:
+                return None
+            self.trace(front, unions, root, int(row_of[0]), int(index_of[0]), result)
+        return result
+
+    def trace(self, front, unions, m, row, index, result):
+        result[m] = row
+        _, own_index, other_index = front[m][row]
+        side = 0 if row < self.split[m] else 1
+        children = self.bracket.children[m]
+        own_child, other_child = children[side], children[1 - side]
+        if own_child >= 0:
+            self.trace(front, unions, own_child, row if side == 0 else row - self.split[m], int(own_index[index]), result)
+        if other_child >= 0:
+            _, rows, indexes = unions[other_child]
+            other = int(other_index[index])
+            self.trace(front, unions, other_child, int(rows[other]), int(indexes[other]), result)
+
+    def random_rows(self, masks, count, rng, prediction=None, follow=0.0):
+        # with a prediction, a predicted team that made it to a match wins
+        # it with probability follow, otherwise it's a coin flip
+        rows = {}
+        for m in self.order:
+            allowed = np.flatnonzero(masks[m])
+            if len(allowed) == 1:
+                rows[m] = np.full(count, allowed[0])
+                continue
+            child_a, child_b = self.bracket.children[m]
+            row_a = rows[child_a] if child_a >= 0 else np.zeros(count, dtype=np.int64)
+            row_b = self.split[m] + (rows[child_b] if child_b >= 0 else np.zeros(count, dtype=np.int64))
+            a_wins = rng.random(count) < 0.5
+            if prediction is not None:
+                follows = rng.random(count) < follow
+                a_wins = np.where(follows & (self.teams[m][row_a] == prediction[m]), True, a_wins)
+                a_wins = np.where(follows & (self.teams[m][row_b] == prediction[m]), False, a_wins)
+            rows[m] = np.where(a_wins, row_a, row_b)
+        return rows
+
+    def score(self, values, rows):
+        # outcomes x columns
+        return sum(values[m][rows[m]] for m in self.order)
+
+    def winners(self, rows, i):
+        return [int(self.teams[m][rows[m][i]]) for m in range(len(self.teams))]
+
+
+class Undecided(Exception):
+    pass
+
+
+class Search:
+    # branch-and-bound for one player over the winners from the final down,
+    # against the rivals that got in the way so far: a rival joins as soon
+    # as an outcome found lets them finish ahead. Leaving rivals out only
+    # makes winning easier, so whatever was pruned before stays pruned.
+    # Quick to find an outcome where the player wins, slow to rule them
+    # out, so it gives up after budget nodes or at the deadline.
+    def __init__(self, outcomes, values, player, rivals, active, budget, stats=None, deadline=None):
+        self.outcomes = outcomes
+        self.values = values
+        self.player = player
+        self.rivals = rivals
+        self.active = list(active)
+        self.margins = margins(values, player, self.active)
+        self.budget = budget
+        self.stats = stats
+        self.deadline = deadline
+
+    def check(self, rows):
+        # True when the player finishes first, otherwise the rivals ahead join
+        scores = self.outcomes.score(self.values, rows)[0]
+        ahead = self.rivals[scores[self.rivals] > scores[self.player]]
+        if len(ahead) == 0:
+            return True
+        self.active += list(ahead[np.argsort(scores[self.player] - scores[ahead])][:4])
+        self.margins = margins(self.values, self.player, self.active)
+        return False
+
+    def run(self, masks, base=None, touched=()):
+        # returns the rows of a winning outcome within masks, or None
+        outcomes = self.outcomes
+        while True:
+            self.budget -= 1
+            if self.budget < 0 or (self.deadline is not None and time.monotonic() > self.deadline):
+                raise Undecided()
+            if self.stats is not None:
+                self.stats["nodes"] += 1
+            if base is not None and next(iter(base.values())).shape[1] != len(self.active):
+                base = None
+            tables = outcomes.tables(self.margins, masks, base, touched)
+            bound = outcomes.bound(tables)
+            if bound.min() < 0:
+                return None
+            tight = int(bound.argmin())
+            rows = outcomes.best_rows({m: t[:, [tight]] for m, t in tables.items()})
+            if outcomes.score(self.margins, rows)[0].min() < 0:
+                break
+            if self.check(rows):
+                return {m: int(r[0]) for m, r in rows.items()}
+            base = None
+
+        # branch on the highest match that is still open, best rows first
+        for m in outcomes.top_down:
+            allowed = np.flatnonzero(masks[m])
+            if len(allowed) > 1:
+                break
+        for row in sorted(allowed, key=lambda r: -tables[m][r, tight]):
+            if tables[m][row, tight] == -np.inf:
+                continue
+            child_masks, child_touched = outcomes.fix(masks, m, row)
+            found = self.run(child_masks, tables, child_touched)
+            if found is not None:
+                return found
+        return None
+
+
+def union(rows, outside=None, beam=None, deadline=None):
+    # the totals of all rows of a subtree together, with the row and the
+    # index within the row for each
+    vectors = np.concatenate([r[0] for r in rows])
+    row_of = np.concatenate([np.full(len(r[0]), i) for i, r in enumerate(rows)]).astype(np.int64)
+    index_of = np.concatenate([np.arange(len(r[0])) for r in rows]).astype(np.int64)
+    if beam is not None and len(vectors) > beam:
+        slack = (vectors + outside[row_of]).min(axis=1)
+        keep = np.argsort(-slack, kind="stable")[:4 * beam]
+        keep = keep[pareto(vectors[keep], deadline=deadline)]
+        keep = keep[np.argsort(-slack[keep], kind="stable")[:beam]]
+    else:
+        keep = pareto(vectors, deadline=deadline)
+    return vectors[keep], row_of[keep], index_of[keep]
+
+def pareto(vectors, block=256, deadline=None):
+    # indices of the vectors that no other vector matches or beats in every
+    # column, the same vector twice is kept once. Sorted by sum, only an
+    # earlier vector can beat a later one. Blocks and the slices of the ones
+    # kept so far they are compared against stay within frontier_cells.
+    if len(vectors) <= 1:
+        return np.arange(len(vectors))
+    block = max(1, min(block, int((frontier_cells // vectors.shape[1]) ** 0.5)))
+    first = np.argsort(-vectors.sum(axis=1), kind="stable")
+    candidates = vectors[first]
+    kept = []
+    keep = np.zeros(len(first), dtype=bool)
+    for start in range(0, len(first), block):
+        if deadline is not None and time.monotonic() > deadline:
+            raise Undecided()
+        chunk = candidates[start:start + block]
+        inner = np.tril((chunk[None, :, :] >= chunk[:, None, :]).all(axis=2), -1)
+        beaten = inner.any(axis=1)
+        if kept:
+            before = np.concatenate(kept)
+            step = max(1, frontier_cells // (len(chunk) * vectors.shape[1]))
+            for i in range(0, len(before), step):
+                beaten |= (before[None, i:i + step, :] >= chunk[:, None, :]).all(axis=2).any(axis=1)
+        keep[start:start + block] = ~beaten
+        kept.append(chunk[~beaten])
+    return first[keep]
+
+def margins(values, player, rivals):
+    return {m: v[:, [player]] - v[:, rivals] for m, v in values.items()}
+
+def can_win(outcomes, values, player, masks, rivals=None, stats=None, rounds=30, budget=200, deadline=None):
+    # returns a winning outcome for the player or None. First a weighted
+    # mix of the margins over every rival: its best outcome bounds all
+    # outcomes, so a negative best means the player is out, and the weights
+    # move towards the rivals that come out ahead until the best outcome is
+    # a win. If that settles nothing, Search starting from the rivals that
+    # ended up with the most weight. Raises Undecided when the frontier
+    # gets too big to settle it or the deadline passes.
+    if rivals is None:
+        rivals = np.array([q for q in range(values[outcomes.order[0]].shape[1]) if q != player], dtype=np.int64)
+    if len(rivals) == 0:
+        own = outcomes.tables({m: v[:, [player]] for m, v in values.items()}, masks)
+        return None if outcomes.bound(own)[0] == -np.inf else {m: int(r[0]) for m, r in outcomes.best_rows(own).items()}
+    own = {m: v[:, player] for m, v in values.items()}
+    against = {m: v[:, rivals] for m, v in values.items()}
+    weights = np.full(len(rivals), 1 / len(rivals))
+    for _ in range(rounds):
+        if deadline is not None and time.monotonic() > deadline:
+            raise Undecided()
+        if stats is not None:
+            stats["nodes"] += 1
+        tables = outcomes.tables({m: (own[m] - against[m] @ weights)[:, None] for m in own}, masks)
+        if outcomes.bound(tables)[0] < -1e-6:
+            return None
+        rows = outcomes.best_rows(tables)
+        scores = outcomes.score(values, rows)[0]
+        margin = scores[player] - scores[rivals]
+        if margin.min() >= 0:
+            return {m: int(r[0]) for m, r in rows.items()}
+        weights = weights * np.exp(-2 * margin / np.abs(margin).max())
+        weights /= weights.sum()
+    active = list(rivals[np.argsort(-weights)[:4]])
+    try:
+        return Search(outcomes, values, player, rivals, active, budget, stats, deadline).run(masks)
+    except Undecided:
+        pass
+
+    # then on the frontier, against the rivals with the most weight first:
+    # a rival that finishes ahead in the outcome found joins and it is done
+    # again. A narrow beam finds most outcomes quickly, the full frontier
+    # settles the rest, keeping the rivals the beam ran into. Leaving rivals
+    # out only makes winning easier, so no outcome against some of them
+    # means none at all.
+    active = list(rivals[np.argsort(-weights)[:4]])
+    for beam in (8, 64, None):
+        while True:
+            if stats is not None:
+                stats["nodes"] += 1
+            found = outcomes.frontier(margins(values, player, active), masks, beam, deadline)
+            if found is None:
+                break
+            scores = outcomes.score(values, {m: np.array([r]) for m, r in found.items()})[0]
+            if (scores[rivals] <= scores[player]).all():
+                return found
+            # the rivals ahead and the closest behind, they tend to be ahead next
+            waiting = np.setdiff1d(rivals, active)
+            active += list(waiting[np.argsort(scores[player] - scores[waiting])][:max(8, len(active) // 2)])
+    return None
+
+def point_range(outcomes, values, masks):
+    # the most and the least bracket points every player can still end up with
+    max_points = outcomes.bound(outcomes.tables(values, masks))
+    min_points = -outcomes.bound(outcomes.tables({m: -v for m, v in values.items()}, masks))
+    return max_points, min_points
+
+def rivals_of(player, max_points, min_points):
+    # nobody can beat a rival who is sure of more than they can reach, so
+    # only the ones who can still end up ahead matter
+    rivals = np.flatnonzero(max_points > min_points[player])
+    return rivals[rivals != player]
+
+@instrumented("chances.elimination")
+def analyze(schedule, records, samples=2000, seed=0, biased_samples=200, time_limit=None):
+    records = list(records)
+    names = [r.name for r in records]
+    outcomes = Outcomes(schedule)
+    players = encode_players(records)
+    values = outcomes.values(players)
+    masks = outcomes.masks
+    stats = {"nodes": 0}
+    num_players = len(records)
+    alive = np.zeros(num_players, dtype=bool)
+    undecided = np.zeros(num_players, dtype=bool)
+    witness = {}
+
+    # cheap first: everybody's own best outcome and some random ones
+    own = outcomes.tables(values, masks)
+    max_points, min_points = point_range(outcomes, values, masks)
+    rng = np.random.default_rng(seed)
+    for rows in (outcomes.best_rows(own), outcomes.random_rows(masks, samples, rng)):
+        scores = outcomes.score(values, rows)
+        leaders = scores >= scores.max(axis=1, keepdims=True)
+        for i, player in zip(*np.nonzero(leaders)):
+            if not alive[player]:
+                alive[player] = True
+                witness[names[player]] = outcomes.winners(rows, i)
+
+    # then outcomes that mostly go the way each player left over predicted,
+    # that settles most of the ones the exact search is slow on
+    dead = max_points < min_points.max()
+    prediction = players["prediction"]
+    for player in np.flatnonzero(~alive & ~dead):
+        for follow in (0.8, 0.95, 1.0):
+            rows = outcomes.random_rows(masks, biased_samples, rng, prediction[player], follow)
+            scores = outcomes.score(values, rows)
+            leads = np.flatnonzero(scores[:, player] >= scores.max(axis=1))
+            if len(leads):
+                alive[player] = True
+                witness[names[player]] = outcomes.winners(rows, leads[0])
+                break
+
+    # then exact for everybody else, a player the frontier gets too big for
+    # or not settled within time_limit seconds is left undecided
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    for player in range(num_players):
+        if alive[player] or dead[player]:
+            continue
+        try:
+            rows = can_win(outcomes, values, player, masks, rivals_of(player, max_points, min_points), stats=stats, deadline=deadline)
+        except Undecided:
+            undecided[player] = True
+            continue
+        if rows is not None:
+            alive[player] = True
+            witness[names[player]] = outcomes.winners({m: [r] for m, r in rows.items()}, 0)
+    return {"names": names, "alive": alive, "undecided": undecided, "max_points": max_points, "witness": witness, "nodes": stats["nodes"]}
+
+def required_results(schedule, records, name, witness=None, time_limit=None):
+    # the open matches a player has to get a certain winner in to still
+    # finish first, as (match, team id), empty when they are out and None
+    # when the search couldn't settle it within time_limit seconds
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    records = list(records)
+    player = [r.name for r in records].index(name)
+    outcomes = Outcomes(schedule)
+    values = outcomes.values(encode_players(records))
+    masks = outcomes.masks
+    max_points, min_points = point_range(outcomes, values, masks)
+    if max_points[player] < min_points.max():
+        return []
+    # the rivals only get fewer as matches are ruled out, so the ones that
+    # matter now cover every search below
+    rivals = rivals_of(player, max_points, min_points)
+    try:
+        if witness is None:
+            rows = can_win(outcomes, values, player, masks, rivals, deadline=deadline)
+            if rows is None:
+                return []
+            witness = outcomes.winners({m: [r] for m, r in rows.items()}, 0)
+        required = []
+        for m in outcomes.open:
+            row = int(np.flatnonzero(outcomes.teams[m] == witness[m])[0])
+            if can_win(outcomes, values, player, outcomes.exclude(masks, m, row)[0], rivals, deadline=deadline) is None:
+                required.append((m, witness[m]))
+    except Undecided:
+        return None
+    return required
@@ -0,0 +1,119 @@
+import csv
+import hashlib
+import io
+import os
+import re
+import tempfile
+import time
+from leaderboard import live_state
+from player_record import player_from_record
+from scoring import update_player
+from instrumentation import count, instrumented
+
+# Player data export, written row by row to a file only when someone asks
+# for it. Files are keyed by the store revision and the live state, so an
+# unchanged pool is exported once and then served from disk.
+
+EXPORT_DIR = "exports"
+columns = ["user", "TeamA", "TeamB", "nextMatch", "nextTeam", "prediction", "status", "goal prediction A", "goal prediction B"]
+formats = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+def export_rows(store, schedule, now=None):
+    if now is None:
+        now = time.time()
+    for name, record in store.iter():
+        player = player_from_record(record, schedule)
+        update_player(player, schedule, now)
+        for match in player["matches"].values():
+            row = [name] + [match[key] for key in columns[1:7]]
+            if "submitted" in match and match["submitted"]:
+                row += [match["goalsAp"], match["goalsBp"]]
+            else:
+                row += ["NA", "NA"]
+            yield row
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_csv(rows, chunk_rows=1000):
+    # same layout as the old DataFrame.to_csv export, including the index column
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow([""] + columns)
+    index = 0
+    for chunk in chunked(rows, chunk_rows):
+        for row in chunk:
+            writer.writerow([index] + row)
+            index += 1
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def write_arrow(rows, f, fmt, chunk_rows=10000):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+    # goal predictions are "NA" when missing, so every column is written as text
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    writer = pq.ParquetWriter(f, schema) if fmt == "parquet" else ipc.new_file(f, schema)
+    try:
+        for chunk in chunked(rows, chunk_rows):
+            arrays = [pa.array([str(row[i]) for row in chunk], pa.string()) for i in range(len(columns))]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+    finally:
+        writer.close()
+
+def export_key(store, schedule, now):
+    # revisions count per store, the pool keeps two pools at the same
+    # revision apart
+    state = repr(sorted(live_state(schedule, now).items()))
+    key = f"{store.revision()}-{hashlib.sha1(state.encode()).hexdigest()[:12]}"
+    return key if store.pool is None else f"{store.pool}-{key}"
+
+@instrumented("export.write")
+def write_export(store, schedule, fmt="csv", directory=EXPORT_DIR, now=None):
+    # returns the path of the export, reusing it if nothing changed since
+    if now is None:
+        now = time.time()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"player_data-{export_key(store, schedule, now)}.{fmt}")
+    if os.path.exists(path):
+        count("export.reused")
+        return path
+    count("export.written")
+    rows = export_rows(store, schedule, now)
+    # a temp file of its own, so concurrent exports of the same key never
+    # write into each other's file
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if fmt == "csv":
+                for chunk in iter_csv(rows):
+                    f.write(chunk)
+            else:
+                write_arrow(rows, f, fmt)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    # older exports of this pool only, other pools share the directory
+    prefix = "player_data-" if store.pool is None else f"player_data-{store.pool}-"
+    own = re.compile(re.escape(prefix) + r"\d+-[0-9a-f]{12}\." + re.escape(fmt) + "$")
+    for old in os.listdir(directory):
+        if own.match(old) and os.path.join(directory, old) != path:
+            os.remove(os.path.join(directory, old))
+    return path
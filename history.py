@@ -0,0 +1,220 @@
+import bisect
+import pickle as pkl
+import threading
+import time
+import zlib
+from instrumentation import instrumented
+
+# Standings over the course of the tournament, kept as an append-only log in
+# the store. Every result that comes in appends an entry with just what
+# changed since the entry before: the results of the matches that changed
+# and how many points the players whose totals changed gained (found with
+# leaderboard_changes), zlib compressed. Every keyframe_every-th entry
+# holds the full results and totals instead, so the standings after any
+# entry are the nearest keyframe plus a few deltas, never a rescore. Ranks
+# are as in RankIndex. Every entry read also keeps the order of the players
+# and their bracket points after it, so a page of the standings or a rank
+# at any entry is a slice or a binary search.
+
+keyframe_every = 16
+
+
+def result_state(schedule):
+    # what a result is, live_state without the kickoff
+    return {match.number: (match.winner, str(match.goals_a), str(match.goals_b), match.done) for match in schedule}
+
+def encode(entry):
+    return zlib.compress(pkl.dumps(entry))
+
+def decode(data):
+    return pkl.loads(zlib.decompress(data))
+
+def ranked(totals):
+    # (rank, name, bracket points, match points), players tied on points
+    # share a rank
+    rows = sorted(totals.items(), key=lambda item: (-item[1][0], item[0]))
+    points = [-totals[0] for _, totals in rows]
+    return [(bisect.bisect_left(points, -totals[0]) + 1, name) + totals for name, totals in rows]
+
+
+def advance(totals, entry, names=None):
+    # the totals after entry, from the ones before it, of just names if given
+    if entry.keyframe:
+        if names is None:
+            return dict(entry.totals)
+        return {name: entry.totals[name] for name in names if name in entry.totals}
+    changed = entry.totals.items() if names is None else ((name, entry.totals[name]) for name in names if name in entry.totals)
+    for name, (bracket, goals) in changed:
+        old = totals.get(name, (0.0, 0.0))
+        totals[name] = (old[0] + bracket, old[1] + goals)
+    return totals
+
+
+class Entry:
+    __slots__ = ("seq", "time", "keyframe", "results", "totals", "leaderboard_seq", "order", "points")
+
+    def __init__(self, seq, time, keyframe, results, totals, leaderboard_seq):
+        # results {match: result} and totals {name: (bracket, goals)}, all of
+        # them in a keyframe, otherwise the changed results and the points
+        # gained
+        self.seq = seq
+        self.time = time
+        self.keyframe = keyframe
+        self.results = results
+        self.totals = totals
+        self.leaderboard_seq = leaderboard_seq
+        # filled in when the entry is read: the ids of the players in
+        # standings order and their negated bracket points, in that order
+        self.order = None
+        self.points = None
+
+
+class History:
+    # The log of one store, read into memory. sync() catches up on entries
+    # appended by other processes, record() appends one when a result
+    # changed. One per store and process, like RankIndex.
+
+    def __init__(self):
+        self.entries = []
+        self.results = {}
+        self.totals = {}
+        # an id per player, and by id: the current bracket points, whether
+        # the player has any yet and the place of the name in name order
+        self.ids = {}
+        self.names = []
+        self.bracket = None
+        self.scored = None
+        self.name_order = None
+        self.finished = {}
+        self._lock = threading.Lock()
+
+    def _apply(self, entry):
+        if entry.keyframe:
+            self.results = {}
+        self.results.update(entry.results)
+        self.totals = advance(self.totals, entry)
+        self._order(entry)
+        for match, result in entry.results.items():
+            if result[3]:
+                self.finished.setdefault(match, entry.seq)
+        self.entries.append(entry)
+
+    def _order(self, entry):
+        # the standings order and points after entry, sorted like RankIndex
+        import numpy as np
+        new = [name for name in entry.totals if name not in self.ids]
+        if new or self.bracket is None:
+            for name in new:
+                self.ids[name] = len(self.names)
+                self.names.append(name)
+            grow = len(self.names) - (0 if self.bracket is None else len(self.bracket))
+            self.bracket = np.concatenate([self.bracket if self.bracket is not None else np.zeros(0), np.zeros(grow)])
+            self.scored = np.concatenate([self.scored if self.scored is not None else np.zeros(0, dtype=bool), np.zeros(grow, dtype=bool)])
+            self.name_order = np.empty(len(self.names), dtype=np.int64)
+            self.name_order[sorted(range(len(self.names)), key=self.names.__getitem__)] = np.arange(len(self.names))
+        if entry.keyframe:
+            self.scored[:] = False
+        ids = np.fromiter((self.ids[name] for name in entry.totals), dtype=np.int64, count=len(entry.totals))
+        self.bracket[ids] = [self.totals[name][0] for name in entry.totals]
+        self.scored[ids] = True
+        scored = np.flatnonzero(self.scored)
+        order = scored[np.lexsort((self.name_order[scored], -self.bracket[scored]))]
+        entry.order = order.astype(np.int32)
+        entry.points = -self.bracket[order]
+
+    def _sync(self, store):
+        for seq, data in store.history(len(self.entries)):
+            self._apply(Entry(seq, *decode(data)))
+
+    def sync(self, store):
+        with self._lock:
+            self._sync(store)
+        return len(self.entries)
+
+    @instrumented("history.record")
+    def record(self, store, schedule, now=None):
+        # call after refresh_leaderboard, True if an entry was appended
+        if now is None:
+            now = time.time()
+        state = result_state(schedule)
+        with self._lock:
+            while True:
+                self._sync(store)
+                changed = {match: result for match, result in state.items() if self.results.get(match) != result}
+                if not changed:
+                    return False
+                since = self.entries[-1].leaderboard_seq if self.entries else 0
+                rows, leaderboard_seq = store.leaderboard_changes(since)
+                seq = len(self.entries) + 1
+                keyframe = seq % keyframe_every == 1
+                if keyframe:
+                    changed = state
+                    totals = {**self.totals, **{name: (bracket, goals) for name, bracket, goals in rows}}
+                else:
+                    # rescored players whose totals stayed the same are left out
+                    totals = {}
+                    for name, bracket, goals in rows:
+                        old = self.totals.get(name, (0.0, 0.0))
+                        if (bracket, goals) != old:
+                            totals[name] = (bracket - old[0], goals - old[1])
+                entry = (now, keyframe, changed, totals, leaderboard_seq)
+                if store.append_history(encode(entry), seq - 1):
+                    self._apply(Entry(seq, *entry))
+                    return True
+                # another process got there first, see what it recorded
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _state(self, seq, names=None):
+        # full results and the totals after entry seq, of just names if
+        # given, from the keyframe before it
+        start = (seq - 1) // keyframe_every * keyframe_every
+        results, totals = {}, {}
+        for entry in self.entries[start:seq]:
+            results.update(entry.results)
+            totals = advance(totals, entry, names)
+        return results, totals
+
+    def standings(self, seq=None, start=0, count=None):
+        # places start to start + count of the ranked leaderboard right
+        # after entry seq, the latest by default, all places by default
+        with self._lock:
+            if not self.entries:
+                return []
+            if seq is None:
+                seq = len(self.entries)
+            entry = self.entries[seq - 1]
+            end = len(entry.order) if count is None else start + count
+            names = [self.names[i] for i in entry.order[start:end]]
+            totals = self._state(seq, None if count is None else names)[1]
+            ranks = entry.points.searchsorted([-totals[name][0] for name in names]) + 1
+            return [(int(rank), name) + totals[name] for rank, name in zip(ranks, names)]
+
+    def results_at(self, seq):
+        with self._lock:
+            return self._state(seq, ())[0]
+
+    def after_match(self, match):
+        # the entry that recorded match as finished, None while it isn't
+        return self.finished.get(match)
+
+    def standings_after_match(self, match, start=0, count=None):
+        seq = self.after_match(match)
+        return None if seq is None else self.standings(seq, start, count)
+
+    def rank_history(self, names):
+        # {name: [(seq, time, rank)]} over every entry, None as rank before
+        # the player had points, for rank movement charts. Only the totals
+        # of these players are followed, ranks come from the points kept
+        # with every entry.
+        history = {name: [] for name in names}
+        with self._lock:
+            totals = {}
+            for entry in self.entries:
+                totals = advance(totals, entry, history)
+                for name, ranks in history.items():
+                    current = totals.get(name)
+                    rank = int(entry.points.searchsorted(-current[0])) + 1 if current is not None else None
+                    ranks.append((entry.seq, entry.time, rank))
+        return history
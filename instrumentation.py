@@ -0,0 +1,170 @@
+import collections
+import cProfile
+import functools
+import inspect
+import os
+import threading
+import time
+
+# Timers and counters around the hot paths: the live feed fetch, store
+# reads and writes, scoring, rendering and the export. Off by default, then
+# an instrumented call costs one flag check. When on, every call lands in a
+# window of recent durations per name, for percentiles, and in the
+# breakdown of the page rerun it happened in, if any. One rerun can also
+# run under cProfile and get its stats dumped to PROFILE_DIR.
+
+PROFILE_DIR = "profiles"
+window = 4096
+
+enabled = os.environ.get("BRACKET_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_durations = collections.defaultdict(lambda: collections.deque(maxlen=window))
+_totals = collections.defaultdict(lambda: [0, 0.0])
+_counters = collections.Counter()
+_runs = collections.defaultdict(lambda: collections.deque(maxlen=50))
+_local = threading.local()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+def record(name, seconds):
+    with _lock:
+        _durations[name].append(seconds)
+        total = _totals[name]
+        total[0] += 1
+        total[1] += seconds
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run.add(name, seconds)
+
+def count(name, amount=1):
+    if enabled:
+        with _lock:
+            _counters[name] += amount
+
+
+class timer:
+    # with timer("name"): ...
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter() if enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            record(self.name, time.perf_counter() - self.start)
+
+
+def instrumented(name):
+    # decorator, a generator function is timed until it is used up
+    def decorate(function):
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator(*args, **kwargs):
+                if not enabled:
+                    return (yield from function(*args, **kwargs))
+                start = time.perf_counter()
+                try:
+                    return (yield from function(*args, **kwargs))
+                finally:
+                    record(name, time.perf_counter() - start)
+            return generator
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class Run:
+    # one rerun of a page: wall time and the time spent per instrumented name
+
+    def __init__(self, page, profile=False):
+        self.page = page
+        self.start = time.perf_counter()
+        self.started = time.time()
+        self.seconds = None
+        self.breakdown = collections.defaultdict(lambda: [0, 0.0])
+        self.profiler = cProfile.Profile() if profile else None
+        self.profile_path = None
+
+    def add(self, name, seconds):
+        entry = self.breakdown[name]
+        entry[0] += 1
+        entry[1] += seconds
+
+def start_run(page, profile=False):
+    # profile only has an effect with the instrumentation on
+    if not enabled:
+        _local.run = None
+        return None
+    run = Run(page, profile)
+    _local.run = run
+    if run.profiler is not None:
+        run.profiler.enable()
+    return run
+
+def end_run():
+    run = getattr(_local, "run", None)
+    _local.run = None
+    if run is None:
+        return None
+    run.seconds = time.perf_counter() - run.start
+    if run.profiler is not None:
+        run.profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        run.profile_path = os.path.join(PROFILE_DIR, f"{run.page}-{int(run.started)}.prof")
+        run.profiler.dump_stats(run.profile_path)
+        run.profiler = None
+    record(f"page.{run.page}", run.seconds)
+    with _lock:
+        _runs[run.page].append(run)
+    return run
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] if ordered else None
+
+def summary():
+    # per name: calls, total seconds, and p50/p95/p99 over the recent window
+    with _lock:
+        durations = {name: list(values) for name, values in _durations.items()}
+        totals = {name: tuple(total) for name, total in _totals.items()}
+    rows = []
+    for name in sorted(durations):
+        values = durations[name]
+        rows.append({
+            "name": name, "calls": totals[name][0], "total": totals[name][1],
+            "p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99),
+        })
+    return rows
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+def recent_runs(page=None):
+    with _lock:
+        pages = [page] if page is not None else list(_runs)
+        return [run for p in pages for run in _runs.get(p, ())]
+
+def reset():
+    with _lock:
+        _durations.clear()
+        _totals.clear()
+        _counters.clear()
+        _runs.clear()
@@ -0,0 +1,160 @@
+import bisect
+import threading
+import time
+from scoring import calculate_points
+from player_record import player_from_record
+from instrumentation import instrumented
+
+
+def live_state(schedule, now=None, matches=None):
+    # everything about a live match that the points of a player depend on,
+    # of every match or just the numbers in matches
+    if now is None:
+        now = time.time()
+    state = {}
+    for match in (schedule if matches is None else (schedule[m] for m in matches)):
+        state[match.number] = (match.winner, str(match.goals_a), str(match.goals_b), match.done, match.kickoff < now)
+    return state
+
+def affected_matches(old_state, new_state, schedule):
+    if old_state.keys() != new_state.keys():
+        return set(new_state)
+    changed = {key for key in new_state if old_state[key] != new_state[key]}
+    affected = set(changed)
+    for key in changed:
+        # a match that started without a prediction changes the bracket
+        # points of every later match it feeds into
+        if old_state[key][4] != new_state[key][4]:
+            affected.update(schedule.bracket.ancestors[key])
+    return affected
+
+@instrumented("scoring.score_rows")
+def score_rows(names, players, versions, schedule, matches=None, now=None):
+    # numpy comes in with the first scoring, not with the page
+    from vector_scoring import encode_live, encode_players, score_players
+    bracket, goals = score_players(encode_players(players), encode_live(schedule, now), schedule.bracket)
+    bracket, goals = bracket.tolist(), goals.tolist()
+    columns = range(len(schedule)) if matches is None else sorted(matches)
+    rows = []
+    for i, (name, version) in enumerate(zip(names, versions)):
+        for match_number in columns:
+            rows.append((name, int(match_number), bracket[i][match_number], goals[i][match_number], version))
+    return rows
+
+@instrumented("scoring.refresh_leaderboard")
+def refresh_leaderboard(store, schedule, now=None, matches=None):
+    # rescore only the matches whose live state changed since the last
+    # refresh, page loads then just read the stored totals. matches, from
+    # the feed's events or the kickoff clock, limits the look to those.
+    if now is None:
+        now = time.time()
+    old_state = store.get_meta("live_state", {})
+    if matches is None or len(old_state) != len(schedule):
+        state = live_state(schedule, now)
+    else:
+        state = dict(old_state)
+        state.update(live_state(schedule, now, matches))
+    matches = affected_matches(old_state, state, schedule)
+    if not matches:
+        return
+    stored = list(store.iter_versioned())
+    if stored:
+        names, players, versions = zip(*stored)
+        store.put_scores(score_rows(names, players, versions, schedule, matches, now))
+    store.set_meta("live_state", state)
+
+def verify_leaderboard(store, schedule, now=None):
+    # compares the materialized totals against scoring every player from scratch
+    stored = {name: (bracket, goals) for name, bracket, goals in store.leaderboard()}
+    mismatches = []
+    for name, record in store.iter():
+        points, _, match_points = calculate_points(player_from_record(record, schedule), schedule, now)
+        if stored.get(name) != (float(points), float(match_points)):
+            mismatches.append((name, stored.get(name), (float(points), float(match_points))))
+    return mismatches
+
+
+class RankIndex:
+    # The materialized leaderboard kept sorted in memory, so a page of it,
+    # the rank of a player or the players around them are a bisect away
+    # instead of sorting every player on every view. Players are ordered by
+    # bracket points, ties by name, and share a rank when tied on points.
+    # sync() catches up on the leaderboard rows changed since the last call.
+
+    def __init__(self):
+        self.keys = []
+        self.names = []
+        self.totals = {}
+        self.seq = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def sync(self, store):
+        # one sync at a time, so older rows never land after newer ones.
+        # Readers only wait for the rows to be applied, not for the store.
+        with self._sync_lock:
+            rows, seq = store.leaderboard_changes(self.seq)
+            with self._lock:
+                if len(rows) > len(self.keys) // 4:
+                    # a first load or a big result, sorting it all at once is quicker
+                    self.totals.update((name, (bracket, goals)) for name, bracket, goals in rows)
+                    self.keys = sorted((-totals[0], name) for name, totals in self.totals.items())
+                    self.names = sorted(self.totals)
+                else:
+                    for name, bracket, goals in rows:
+                        self._update(name, bracket, goals)
+                self.seq = seq
+        return len(rows)
+
+    def _update(self, name, bracket, goals):
+        old = self.totals.get(name)
+        if old is None:
+            bisect.insort(self.names, name)
+        else:
+            del self.keys[bisect.bisect_left(self.keys, (-old[0], name))]
+        bisect.insort(self.keys, (-bracket, name))
+        self.totals[name] = (bracket, goals)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _row(self, key):
+        name = key[1]
+        rank = bisect.bisect_left(self.keys, (key[0],)) + 1
+        return (rank, name) + self.totals[name]
+
+    def rank(self, name):
+        # None for players without a score yet
+        with self._lock:
+            totals = self.totals.get(name)
+            return None if totals is None else bisect.bisect_left(self.keys, (-totals[0],)) + 1
+
+    def page(self, start, count):
+        # (rank, name, bracket points, match points) for places start to start + count
+        with self._lock:
+            return [self._row(key) for key in self.keys[start:start + count]]
+
+    def around(self, name, radius=5):
+        with self._lock:
+            totals = self.totals.get(name)
+            if totals is None:
+                return []
+            position = bisect.bisect_left(self.keys, (-totals[0], name))
+            return [self._row(key) for key in self.keys[max(0, position - radius):position + radius + 1]]
+
+    def position(self, name):
+        # place in the sorted order, which page starts count in
+        with self._lock:
+            totals = self.totals.get(name)
+            return None if totals is None else bisect.bisect_left(self.keys, (-totals[0], name))
+
+    def search(self, prefix, limit=20):
+        # names starting with prefix, in name order
+        with self._lock:
+            start = bisect.bisect_left(self.names, prefix)
+            found = []
+            for name in self.names[start:start + limit]:
+                if not name.startswith(prefix):
+                    break
+                found.append(name)
+            return found
@@ -0,0 +1,455 @@
+import asyncio
+import collections
+import concurrent.futures
+import csv
+import functools
+import hashlib
+import http.client
+import io
+import math
+import random
+import threading
+import time
+import traceback
+import urllib.parse
+from schedule import build_schedule
+from teams import sync_teams
+from instrumentation import instrumented
+
+
+def csv_url(sheets_url):
+    return sheets_url.replace("/edit#gid=", "/export?format=csv&gid=")
+
+class ConnectionPool:
+    # Keep-alive HTTP connections per host, reused by every fetch and
+    # refresh instead of a new connection (and TLS handshake) per request.
+
+    def __init__(self):
+        self._idle = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _connection(self, key, timeout):
+        with self._lock:
+            if self._idle[key]:
+                return self._idle[key].pop(), True
+        scheme, host = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(host, timeout=timeout), False
+
+    def request(self, url, headers=None, timeout=10, redirects=5):
+        # returns (status, headers, body), follows redirects like the sheet
+        # export does to googleusercontent
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        while True:
+            connection, reused = self._connection(key, timeout)
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            try:
+                connection.request("GET", path, headers=headers or {})
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionError):
+                connection.close()
+                # the server dropped an idle connection, a fresh one is
+                # worth one more try
+                if not reused:
+                    raise
+            except Exception:
+                connection.close()
+                raise
+        if response.will_close:
+            connection.close()
+        else:
+            with self._lock:
+                self._idle[key].append(connection)
+        location = response.getheader("Location")
+        if response.status in (301, 302, 303, 307, 308) and location and redirects > 0:
+            return self.request(urllib.parse.urljoin(url, location), headers, timeout, redirects - 1)
+        return response.status, response.headers, body
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+default_pool = ConnectionPool()
+
+@instrumented("feed.fetch")
+def fetch_csv(url, etag=None, timeout=10, pool=default_pool):
+    # returns (body, etag), body is None if the server says nothing changed.
+    # Plain paths and file:// urls are read from disk, which together with
+    # any local http server stands in for the google sheet when offline.
+    if url.startswith("file://") or "://" not in url:
+        with open(url[len("file://"):] if url.startswith("file://") else url, "rb") as f:
+            return f.read(), None
+    status, headers, body = pool.request(url, {"If-None-Match": etag} if etag is not None else None, timeout)
+    if status == 304:
+        return None, etag
+    if status != 200:
+        raise IOError(f"HTTP {status} from {url}")
+    return body, headers.get("ETag")
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class Source:
+    # One CSV of the live data (a tab of the sheet, a goal feed, ...) with
+    # its own timeout, retries with exponential backoff and a circuit
+    # breaker: after failures_to_open failed refreshes in a row it is left
+    # alone for cooldown seconds, then tried once again. body is the last
+    # good download and keeps being used while the source fails.
+
+    def __init__(self, name, url, timeout=10, retries=2, backoff=0.5, failures_to_open=3, cooldown=60):
+        self.name = name
+        self.url = csv_url(url)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failures_to_open = failures_to_open
+        self.cooldown = cooldown
+        self.etag = None
+        self.body = None
+        self.error = None
+        self.failures = 0
+        self.open_until = 0.0
+
+    def is_open(self, now):
+        return now < self.open_until
+
+    def failed(self, error, now):
+        self.error = error
+        self.failures += 1
+        if self.failures >= self.failures_to_open:
+            self.open_until = now + self.cooldown
+
+async def fetch_source(source, pool, executor):
+    # returns True if the source has a new body. The download runs on
+    # executor, a fetch that overruns its timeout is left to finish there
+    # without holding up the refresh.
+    if source.is_open(time.time()):
+        raise CircuitOpen(source.name)
+    loop = asyncio.get_running_loop()
+    for attempt in range(source.retries + 1):
+        try:
+            fetch = functools.partial(fetch_csv, source.url, source.etag, source.timeout, pool)
+            body, etag = await asyncio.wait_for(loop.run_in_executor(executor, fetch), source.timeout)
+            break
+        except Exception as e:
+            if attempt == source.retries:
+                source.failed(e, time.time())
+                raise
+            await asyncio.sleep(source.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+    source.etag, source.error, source.failures = etag, None, 0
+    if body is None or body == source.body:
+        return False
+    source.body = body
+    return True
+
+async def fetch_sources(sources, pool, executor):
+    # all at once, a slow or failing source only costs its own timeout
+    return await asyncio.gather(*(fetch_source(source, pool, executor) for source in sources), return_exceptions=True)
+
+def make_sources(sheets_url, timeout=10):
+    # one url, a list of urls or a dict of name -> url, the first source is
+    # the bracket every other one is merged into
+    if isinstance(sheets_url, str):
+        sheets_url = [sheets_url]
+    if not isinstance(sheets_url, dict):
+        sheets_url = {f"source{i}" if i else "bracket": url for i, url in enumerate(sheets_url)}
+    return [Source(name, url, timeout) for name, url in sheets_url.items()]
+
+def is_empty(value):
+    return value is None or value == "" or (isinstance(value, float) and math.isnan(value))
+
+def merge_live_data(tables):
+    # the first table has a row per match, later ones fill in or override
+    # the cells they have a value for. A table with a "match" column gives
+    # the match of every row, otherwise rows line up by position.
+    live = {key: dict(row) for key, row in tables[0].items()}
+    keys = list(live)
+    for table in tables[1:]:
+        for position, row in enumerate(table.values()):
+            key = row.get("match")
+            if is_empty(key):
+                if position >= len(keys):
+                    continue
+                key = keys[position]
+            else:
+                key = int(key)
+            if key not in live:
+                continue
+            for column, value in row.items():
+                if column != "match" and not is_empty(value):
+                    live[key][column] = value
+    return live
+
+@instrumented("feed.parse")
+def parse_column(values):
+    # the types pandas.read_csv would give the column: int, float with nan
+    # for empty cells, bool, or text with nan for empty cells
+    present = [v for v in values if v != ""]
+    if not present:
+        return [math.nan] * len(values)
+    if all(v.lower() in ("true", "false") for v in present):
+        # the spellings pandas reads as bools, sheets export TRUE/FALSE
+        return [v.lower() == "true" if v != "" else math.nan for v in values]
+    for convert in (int, float):
+        try:
+            converted = [convert(v) for v in present]
+        except ValueError:
+            continue
+        if convert is int and len(present) == len(values):
+            return converted
+        converted = iter(converted)
+        return [float(next(converted)) if v != "" else math.nan for v in values]
+    return [v if v != "" else math.nan for v in values]
+
+def parse_live_data(body):
+    # {row: {column: value}} like pd.read_csv(...).transpose().to_dict(),
+    # without loading pandas for it
+    rows = list(csv.reader(io.StringIO(body.decode("utf-8-sig"))))
+    if not rows:
+        return {}
+    header, rows = rows[0], [row for row in rows[1:] if row]
+    columns = [parse_column([row[i] if i < len(row) else "" for row in rows]) for i in range(len(header))]
+    return {index: {name: column[index] for name, column in zip(header, columns)} for index in range(len(rows))}
+
+MatchEvent = collections.namedtuple("MatchEvent", ["match", "kind", "old", "new"])
+
+# which columns of the sheet make up each kind of event
+event_columns = {
+    "teams": ("TeamA", "TeamB"),
+    "winner": ("winner",),
+    "goals": ("goalsA", "goalsB"),
+    "done": ("done",),
+    "kickoff": ("datetime",),
+}
+
+def same_value(a, b):
+    # empty cells come in as NaN, which isn't equal to itself
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b
+
+def diff_live_data(old, new):
+    events = []
+    for key, live_match in new.items():
+        if key not in old:
+            events.append(MatchEvent(key, "added", None, live_match))
+            continue
+        for kind, columns in event_columns.items():
+            old_values = tuple(old[key].get(c) for c in columns)
+            new_values = tuple(live_match.get(c) for c in columns)
+            if not all(same_value(a, b) for a, b in zip(old_values, new_values)):
+                if len(columns) == 1:
+                    old_values, new_values = old_values[0], new_values[0]
+                events.append(MatchEvent(key, kind, old_values, new_values))
+    for key, live_match in old.items():
+        if key not in new:
+            events.append(MatchEvent(key, "removed", live_match, None))
+    return events
+
+def event_matches(events):
+    # the match numbers the events are about, rows of the sheet are the
+    # matches in order. None when matches were added or removed, then
+    # every match has to be looked at again.
+    if any(event.kind in ("added", "removed") for event in events):
+        return None
+    return {event.match for event in events}
+
+
+class LiveFeed:
+    # Process wide copy of the live sheet. A background thread refetches it
+    # every interval seconds and readers always get the last good snapshot
+    # right away (stale-while-revalidate), only the very first read waits
+    # for a fetch. Every change is diffed against the previous snapshot and
+    # the resulting MatchEvents go to the subscribers. With a shared store
+    # the sheet is fetched by one process per interval and the others pick
+    # up the same snapshot, so all of them serve the same results.
+    # sheets_url can also be several sources (see make_sources), they are
+    # fetched concurrently and merged into one live table. The ids of teams
+    # are kept in the teams store, see sync_teams.
+
+    def __init__(self, sheets_url, interval=60, timeout=10, shared=None, teams=None):
+        self.sources = make_sources(sheets_url, timeout)
+        self.url = " ".join(source.url for source in self.sources)
+        self.pool = ConnectionPool()
+        self.executor = concurrent.futures.ThreadPoolExecutor(2 * len(self.sources) + 2, thread_name_prefix="live-feed-fetch")
+        self.shared = shared
+        self.teams = teams
+        self.interval = interval
+        self.timeout = timeout
+        self.live_data = None
+        self.schedule = None
+        self.digest = None
+        self.updated = None
+        self.checked = None
+        self.error = None
+        self.events = []
+        # (schedule before, matches changed) of the last few changes, see
+        # changed_since
+        self.changes = collections.deque(maxlen=32)
+        self._subscribers = []
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @instrumented("feed.refresh")
+    def refresh(self):
+        # returns True if the sheet changed
+        bodies = self.fetch_shared()
+        self.checked = time.time()
+        if bodies[0] is None:
+            # nothing to merge into before the bracket came in once
+            raise self.sources[0].error or CircuitOpen(self.sources[0].name)
+        digest = hashlib.sha1(b"\0".join(body or b"" for body in bodies)).hexdigest()
+        if digest == self.digest:
+            return False
+        live_data = merge_live_data([parse_live_data(body) for body in bodies if body is not None])
+        if self.teams is not None:
+            sync_teams(self.teams, (row[column] for row in live_data.values() for column in ("TeamA", "TeamB", "winner") if isinstance(row[column], str) and row[column] != "NONE"))
+        schedule = build_schedule(live_data)
+        events = diff_live_data(self.live_data or {}, live_data)
+        self.changes.append((self.schedule, event_matches(events)))
+        self.live_data, self.schedule = live_data, schedule
+        self.digest = digest
+        self.updated = self.checked
+        self.events = events
+        self._ready.set()
+        for callback in list(self._subscribers):
+            try:
+                callback(events, schedule)
+            except Exception:
+                traceback.print_exc()
+        return True
+
+    def fetch_sources(self):
+        # the current body of every source, the last good one for a source
+        # that failed this time
+        asyncio.run(fetch_sources(self.sources, self.pool, self.executor))
+        return [source.body for source in self.sources]
+
+    def fetch_shared(self):
+        if self.shared is None:
+            return self.fetch_sources()
+        snapshot = self.shared.get_meta("live_sheet")
+        if snapshot is not None and snapshot["url"] == self.url and "bodies" in snapshot and snapshot["checked"] > time.time() - self.interval:
+            return snapshot["bodies"]
+        bodies = self.fetch_sources()
+        if bodies[0] is not None:
+            self.shared.set_meta("live_sheet", {"url": self.url, "bodies": bodies, "checked": time.time()})
+        return bodies
+
+    def changed_since(self, schedule):
+        # the matches that changed from schedule, an earlier one of this
+        # feed, to the latest, None when that isn't known anymore
+        if schedule is self.schedule:
+            return set()
+        changes = list(self.changes)
+        for i, (before, _) in enumerate(changes):
+            if before is schedule:
+                matches = set()
+                for _, changed in changes[i:]:
+                    if changed is None:
+                        return None
+                    matches |= changed
+                return matches
+        return None
+
+    def subscribe(self, callback):
+        # callback(events, schedule) runs on the refresh thread after every change
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                # a failing source doesn't stop the refresh, but shows here
+                self.error = next((source.error for source in self.sources if source.error is not None), None)
+            except Exception as e:
+                # keep serving the last snapshot and try again next round
+                self.error = e
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def get(self, timeout=30):
+        if not self._ready.wait(timeout):
+            raise RuntimeError(f"no live data from {self.url}: {self.error!r}")
+        return self.live_data
+
+    def get_schedule(self, timeout=30):
+        self.get(timeout)
+        return self.schedule
+
+
+class KickoffClock:
+    # Wakes up right when the next match of the feed's schedule kicks off
+    # and tells the subscribers which matches just locked, so nothing that
+    # depends on a kickoff has to wait for the next page view. A new
+    # schedule from the feed re-arms it.
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.since = None
+        self._subscribers = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        feed.subscribe(lambda events, schedule: self._wake.set())
+
+    def subscribe(self, callback):
+        # callback(locked match numbers, schedule) runs on the clock thread
+        self._subscribers.append(callback)
+        return callback
+
+    def _run(self):
+        schedule = self.feed.get_schedule(timeout=None)
+        self.since = time.time()
+        while not self._stop.is_set():
+            next_kickoff = schedule.kickoffs.next_kickoff(time.time())
+            # locked means kicked off strictly before now
+            timeout = None if next_kickoff is None else max(0.0, next_kickoff - time.time()) + 0.001
+            self._wake.wait(timeout)
+            self._wake.clear()
+            schedule = self.feed.get_schedule()
+            now = time.time()
+            locked = [m for m in schedule.kickoffs.locked_matches(now) if schedule[m].kickoff >= self.since]
+            self.since = now
+            if not locked:
+                continue
+            for callback in list(self._subscribers):
+                try:
+                    callback(locked, schedule)
+                except Exception:
+                    traceback.print_exc()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="kickoff-clock", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,61 @@
+from bracket import slots
+
+# Editing a player's bracket picks. A changed pick moves forward through
+# the bracket only as far as later picks were riding on the old team, and
+# the matches it touched are returned so statuses, the open picks and the
+# drawing can be updated for just those.
+
+
+def apply_choice(matches, bracket, index, choice):
+    dirty = {index}
+    old_team = matches[index]["prediction"]
+    matches[index]["prediction"] = choice
+    current_match = index
+    while bracket.parent[current_match] != -1:
+        next_match = bracket.parent[current_match]
+        matches[next_match][slots[bracket.slot[current_match]]] = choice
+        dirty.add(next_match)
+        if old_team == "Not Decided" or matches[next_match]["prediction"] != old_team:
+            break
+        matches[next_match]["prediction"] = choice
+        current_match = next_match
+    return dirty
+
+def pick_side(match):
+    # 0 no pick, 1 TeamA, 2 TeamB
+    if match["prediction"] == "Not Decided":
+        return 0
+    if match["prediction"] == match["TeamA"]:
+        return 1
+    if match["prediction"] == match["TeamB"]:
+        return 2
+    return 0
+
+def propagate_picks(matches, bracket):
+    # full recomputation: every pick is kept as a side and the teams are
+    # filled in again from the first round, a pick for a team that is no
+    # longer in the match is cleared
+    sides = [pick_side(matches[m]) for m in range(bracket.num_matches)]
+    for match_number in bracket.order:
+        match = matches[match_number]
+        side = sides[match_number]
+        team = match[slots[side - 1]] if side else "Not Decided"
+        match["prediction"] = team
+        if bracket.parent[match_number] != -1:
+            matches[bracket.parent[match_number]][slots[bracket.slot[match_number]]] = team
+    return matches
+
+def is_open(match):
+    return match["prediction"] == "Not Decided" and match["status"] != "NOT_VOTED"
+
+def open_matches(matches):
+    # picks still missing before the form can be submitted
+    return {key for key, match in matches.items() if is_open(match)}
+
+def update_open(open_set, matches, dirty):
+    for key in dirty:
+        if is_open(matches[key]):
+            open_set.add(key)
+        else:
+            open_set.discard(key)
+    return open_set
@@ -0,0 +1,97 @@
+import struct
+from array import array
+from teams import team_ids, team_names
+
+# Compact stored form of a player: only what the player entered, as fixed
+# width arrays of team ids (teams.py) and goals, one entry per match. The
+# tournament structure (nextMatch/nextTeam, kickoffs, results) lives once
+# in the schedule and is only joined back in by player_from_record.
+
+FORMAT = 1
+_header = struct.Struct("<BBH")
+_fields = (("team_a", "H"), ("team_b", "H"), ("prediction", "H"), ("goals_a", "h"), ("goals_b", "h"), ("match_submitted", "B"))
+
+
+class PlayerRecord:
+    __slots__ = ("name", "submitted", "team_a", "team_b", "prediction", "goals_a", "goals_b", "match_submitted")
+
+    def __init__(self, name, num_matches, submitted=False):
+        self.name = name
+        self.submitted = submitted
+        self.team_a = array("H", bytes(2 * num_matches))
+        self.team_b = array("H", bytes(2 * num_matches))
+        self.prediction = array("H", bytes(2 * num_matches))
+        # -1 means no goal prediction
+        self.goals_a = array("h", [-1]) * num_matches
+        self.goals_b = array("h", [-1]) * num_matches
+        self.match_submitted = array("B", bytes(num_matches))
+
+    def __len__(self):
+        return len(self.prediction)
+
+    def __eq__(self, other):
+        return isinstance(other, PlayerRecord) and all(getattr(self, a) == getattr(other, a) for a in self.__slots__)
+
+    def to_bytes(self):
+        header = _header.pack(FORMAT, self.submitted, len(self))
+        return header + b"".join(getattr(self, field).tobytes() for field, _ in _fields)
+
+    @classmethod
+    def from_bytes(cls, name, data):
+        _, submitted, num_matches = _header.unpack_from(data)
+        record = cls.__new__(cls)
+        record.name = name
+        record.submitted = bool(submitted)
+        offset = _header.size
+        for field, typecode in _fields:
+            values = array(typecode)
+            size = values.itemsize * num_matches
+            values.frombytes(data[offset:offset + size])
+            setattr(record, field, values)
+            offset += size
+        return record
+
+
+def is_record(data):
+    # pickled players start with the pickle protocol opcode 0x80
+    return data[:1] == bytes([FORMAT])
+
+def new_record(name, schedule):
+    record = PlayerRecord(name, len(schedule))
+    for i, scheduled in enumerate(schedule):
+        record.team_a[i] = scheduled.team_a
+        record.team_b[i] = scheduled.team_b
+    return record
+
+def record_from_player(name, player):
+    # team names must be in teams.country_codes, the same as for rendering
+    matches = list(player["matches"].values())
+    record = PlayerRecord(name, len(matches), bool(player["submitted"]))
+    for i, match in enumerate(matches):
+        record.team_a[i] = team_ids[match["TeamA"]]
+        record.team_b[i] = team_ids[match["TeamB"]]
+        record.prediction[i] = team_ids[match["prediction"]]
+        if "submitted" in match and match["submitted"]:
+            record.match_submitted[i] = 1
+            record.goals_a[i] = match["goalsAp"]
+            record.goals_b[i] = match["goalsBp"]
+    return record
+
+def player_from_record(record, schedule):
+    # the dict form the pages edit and display, statuses are filled in by update_player
+    matches = {}
+    for i, scheduled in enumerate(schedule):
+        match = {
+            "TeamA": team_names[record.team_a[i]],
+            "TeamB": team_names[record.team_b[i]],
+            "prediction": team_names[record.prediction[i]],
+            "status": "EMPTY",
+            "nextMatch": scheduled.next_match,
+            "nextTeam": scheduled.next_team,
+        }
+        if record.match_submitted[i]:
+            match["submitted"] = True
+            match["goalsAp"] = record.goals_a[i]
+            match["goalsBp"] = record.goals_b[i]
+        matches[i] = match
+    return {"name": record.name, "matches": matches, "submitted": record.submitted}
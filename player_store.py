@@ -0,0 +1,342 @@
+import os
+import pickle as pkl
+import sqlite3
+import threading
+from player_record import PlayerRecord, is_record, record_from_player
+from instrumentation import count, instrumented
+
+DB_PATH = "player_states.db"
+PICKLE_PATH = "player_states.pkl"
+
+
+class VersionConflict(Exception):
+    pass
+
+
+def decode_player(name, data):
+    # rows written before the compact format hold pickled player dicts
+    if is_record(data):
+        return PlayerRecord.from_bytes(name, data)
+    return record_from_player(name, pkl.loads(data))
+
+
+class PlayerStore:
+    # One row per player, keyed by name, so reading or writing a single
+    # player never touches the other entries. Players are PlayerRecords.
+
+    def __init__(self, path=DB_PATH, pool=None):
+        self.path = path
+        self.pool = pool
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS players ("
+            "name TEXT PRIMARY KEY, "
+            "data BLOB NOT NULL, "
+            "version INTEGER NOT NULL DEFAULT 1)"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(players)")]
+        if "version" not in columns:
+            conn.execute("ALTER TABLE players ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        # materialized leaderboard: per player and match points, the
+        # per player totals and the live state they were scored against
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "name TEXT NOT NULL, "
+            "match INTEGER NOT NULL, "
+            "bracket REAL NOT NULL, "
+            "goals REAL NOT NULL, "
+            "version INTEGER NOT NULL, "
+            "PRIMARY KEY (name, match))"
+        )
+        # seq orders the leaderboard changes, so readers can catch up on
+        # just the rows that changed since they last looked
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS leaderboard ("
+            "name TEXT PRIMARY KEY, "
+            "bracket REAL NOT NULL, "
+            "goals REAL NOT NULL, "
+            "seq INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(leaderboard)")]
+        if "seq" not in columns:
+            conn.execute("ALTER TABLE leaderboard ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS leaderboard_seq ON leaderboard (seq)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB)")
+        # append-only standings history, see history.py
+        conn.execute("CREATE TABLE IF NOT EXISTS history (seq INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+        conn.commit()
+
+    def _conn(self):
+        # sqlite connections can't be shared between threads and streamlit
+        # runs every session in its own thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, name, default=None):
+        return self.get_versioned(name, default)[0]
+
+    @instrumented("store.get")
+    def get_versioned(self, name, default=None):
+        # version 0 means the player has never been stored
+        row = self._conn().execute("SELECT data, version FROM players WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return default, 0
+        count("store.rows_read")
+        return decode_player(name, row[0]), row[1]
+
+    @instrumented("store.put")
+    def put(self, name, player, expected_version=None):
+        # with expected_version the write only goes through if nobody else
+        # stored the player since it was read (compare-and-swap), every
+        # statement runs in its own transaction so a crash never leaves a
+        # half written row behind
+        data = player.to_bytes()
+        conn = self._conn()
+        with conn:
+            if expected_version is None:
+                conn.execute(
+                    "INSERT INTO players (name, data) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET data = excluded.data, version = version + 1",
+                    (name, data),
+                )
+            elif expected_version == 0:
+                cur = conn.execute(
+                    "INSERT INTO players (name, data) VALUES (?, ?) ON CONFLICT(name) DO NOTHING",
+                    (name, data),
+                )
+                if cur.rowcount == 0:
+                    count("store.version_conflicts")
+                    raise VersionConflict(name)
+            else:
+                cur = conn.execute(
+                    "UPDATE players SET data = ?, version = version + 1 WHERE name = ? AND version = ?",
+                    (data, name, expected_version),
+                )
+                if cur.rowcount == 0:
+                    count("store.version_conflicts")
+                    raise VersionConflict(name)
+            count("store.rows_written")
+            return conn.execute("SELECT version FROM players WHERE name = ?", (name,)).fetchone()[0]
+
+    def update(self, name, change, default=None, retries=10):
+        # read-modify-write that retries on concurrent writes instead of
+        # overwriting them, change gets a copy of the stored player and
+        # returns the new one
+        for _ in range(retries):
+            player, version = self.get_versioned(name)
+            if player is None:
+                player = PlayerRecord.from_bytes(name, default.to_bytes())
+            player = change(player)
+            try:
+                return player, self.put(name, player, expected_version=version)
+            except VersionConflict:
+                continue
+        raise VersionConflict(name)
+
+    @instrumented("store.write_batch")
+    def write_batch(self, writes):
+        # many submits in one transaction with a synced commit. Writes are
+        # (name, change, default, expected_version): change gets a copy of
+        # the stored player (or of default) and returns the new one, with
+        # expected_version only if nobody stored the player since. Returns
+        # (player, version) per write or the exception that stopped it, a
+        # VersionConflict or whatever change raised.
+        conn = self._conn()
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("BEGIN IMMEDIATE")
+        results = []
+        try:
+            for name, change, default, expected_version in writes:
+                row = conn.execute("SELECT data, version FROM players WHERE name = ?", (name,)).fetchone()
+                version = 0 if row is None else row[1]
+                if expected_version is not None and version != expected_version:
+                    count("store.version_conflicts")
+                    results.append(VersionConflict(name))
+                    continue
+                player = decode_player(name, row[0]) if row is not None else PlayerRecord.from_bytes(name, default.to_bytes())
+                try:
+                    player = change(player)
+                except Exception as e:
+                    results.append(e)
+                    continue
+                conn.execute(
+                    "INSERT INTO players (name, data) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET data = excluded.data, version = version + 1",
+                    (name, player.to_bytes()),
+                )
+                results.append((player, version + 1))
+            conn.commit()
+            count("store.rows_written", sum(isinstance(result, tuple) for result in results))
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return results
+
+    @instrumented("store.put_many")
+    def put_many(self, players):
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO players (name, data) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET data = excluded.data, version = version + 1",
+                ((name, player.to_bytes()) for name, player in players.items()),
+            )
+        count("store.rows_written", len(players))
+
+    def names(self):
+        return [row[0] for row in self._conn().execute("SELECT name FROM players ORDER BY rowid")]
+
+    @instrumented("store.iter")
+    def iter(self):
+        for name, data in self._conn().execute("SELECT name, data FROM players ORDER BY rowid"):
+            count("store.rows_read")
+            yield name, decode_player(name, data)
+
+    @instrumented("store.iter")
+    def iter_versioned(self):
+        for name, data, version in self._conn().execute("SELECT name, data, version FROM players ORDER BY rowid"):
+            count("store.rows_read")
+            yield name, decode_player(name, data), version
+
+    def compact(self):
+        # rewrites rows still holding pickled player dicts in the compact format
+        conn = self._conn()
+        legacy = [(name, data) for name, data in conn.execute("SELECT name, data FROM players") if not is_record(data)]
+        with conn:
+            conn.executemany(
+                "UPDATE players SET data = ? WHERE name = ?",
+                ((decode_player(name, data).to_bytes(), name) for name, data in legacy),
+            )
+        return len(legacy)
+
+    def get_meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        return pkl.loads(row[0])
+
+    def set_meta(self, key, value):
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, pkl.dumps(value)))
+
+    def update_meta(self, key, change, default=None):
+        # change gets the stored value (or default) and returns the new one,
+        # read and written in one transaction. Returns the new value.
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            value = change(default if row is None else pkl.loads(row[0]))
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, pkl.dumps(value)))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return value
+
+    @instrumented("store.put_scores")
+    def put_scores(self, rows):
+        # rows are (name, match, bracket points, match points, player version),
+        # rows scored from an older version of a player than the stored ones
+        # are dropped so a slow rescore can't undo a fresh submit
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO scores (name, match, bracket, goals, version) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name, match) DO UPDATE SET "
+                "bracket = excluded.bracket, goals = excluded.goals, version = excluded.version "
+                "WHERE excluded.version >= scores.version",
+                rows,
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO leaderboard (name, bracket, goals, seq) "
+                "SELECT name, SUM(bracket), SUM(goals), (SELECT COALESCE(MAX(seq), 0) + 1 FROM leaderboard) "
+                "FROM scores WHERE name = ? GROUP BY name",
+                ((name,) for name in {row[0] for row in rows}),
+            )
+
+    @instrumented("store.leaderboard")
+    def leaderboard(self):
+        return self._conn().execute(
+            "SELECT l.name, l.bracket, l.goals FROM leaderboard l JOIN players p ON p.name = l.name ORDER BY p.rowid"
+        ).fetchall()
+
+    @instrumented("store.leaderboard_changes")
+    def leaderboard_changes(self, since=0):
+        # the leaderboard rows written after since, and the seq to pass next time
+        rows = self._conn().execute(
+            "SELECT name, bracket, goals, seq FROM leaderboard WHERE seq > ? ORDER BY seq", (since,)
+        ).fetchall()
+        return [row[:3] for row in rows], (rows[-1][3] if rows else since)
+
+    def append_history(self, data, after):
+        # appends entry after + 1, False if somebody else appended it first
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute("INSERT INTO history (seq, data) VALUES (?, ?)", (after + 1, data))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def history(self, since=0):
+        # (seq, data) of the entries after since
+        return self._conn().execute("SELECT seq, data FROM history WHERE seq > ? ORDER BY seq", (since,)).fetchall()
+
+    def __iter__(self):
+        return self.iter()
+
+    def revision(self):
+        # every write bumps one version by one, so the sum only ever grows
+        return self._conn().execute("SELECT COALESCE(SUM(version), 0) FROM players").fetchone()[0]
+
+    def __contains__(self, name):
+        return self._conn().execute("SELECT 1 FROM players WHERE name = ?", (name,)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM players").fetchone()[0]
+
+
+def open_store(url=DB_PATH, pool=None):
+    # where the shared state lives: a SQLite file (the default, shared by
+    # the processes on one machine), redis://... for a Redis server shared
+    # by processes anywhere, or memory:// for an in-process stand-in.
+    # pool opens that pool's shard of it: its own SQLite file next to the
+    # default one, so writers of one pool never wait on another's lock, or
+    # its own key prefix on the Redis server.
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        import redis
+        from redis_store import RedisPlayerStore
+        return RedisPlayerStore(redis.Redis.from_url(url), prefix=shard_prefix(pool), pool=pool)
+    if url.startswith("memory://"):
+        from redis_store import LocalRedis, RedisPlayerStore
+        return RedisPlayerStore(LocalRedis(), prefix=shard_prefix(pool), pool=pool)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    if pool is not None:
+        root, ext = os.path.splitext(url)
+        url = f"{root}-{pool}{ext}"
+    return PlayerStore(url, pool=pool)
+
+def shard_prefix(pool):
+    return "bracket:" if pool is None else f"bracket:{pool}:"
+
+def migrate_pickle(store, path=PICKLE_PATH):
+    # one-shot import of the old whole-file pickle, the file is renamed
+    # afterwards so the import doesn't run again
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        players = pkl.load(f)
+    store.put_many({name: record_from_player(name, player) for name, player in players.items()})
+    os.replace(path, path + ".migrated")
+    return len(players)
@@ -0,0 +1,85 @@
+import re
+from player_store import DB_PATH
+
+# Several pools, each a group of players guessing one tournament, served by
+# the same app. Configured in the secrets:
+#
+#   state_url = "sqlite:///player_states.db"
+#
+#   [tournaments.wc2023]
+#   sheets_url = "https://docs.google.com/..."
+#   live_sources = []
+#
+#   [pools.family]
+#   name = "Family"
+#   tournament = "wc2023"
+#
+#   [pools.office]
+#   name = "Office"
+#   tournament = "wc2023"
+#   state_url = "redis://big-pool-server"
+#
+# Every pool gets its own shard of state_url (see open_store) unless it
+# sets its own. Pools of the same tournament share its live feed, which is
+# fetched once for all of them. Without a pools section there is the one
+# pool the app always had, on public_gsheets_url and the default store.
+
+DEFAULT = "default"
+valid_id = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class Tournament:
+    __slots__ = ("tournament_id", "sources", "state_url", "shard")
+
+    def __init__(self, tournament_id, sources, state_url, shard):
+        # the live feed's snapshot is kept in the shard, for every process
+        self.tournament_id = tournament_id
+        self.sources = sources
+        self.state_url = state_url
+        self.shard = shard
+
+
+class Pool:
+    __slots__ = ("pool_id", "name", "tournament", "state_url", "shard")
+
+    def __init__(self, pool_id, name, tournament, state_url, shard):
+        self.pool_id = pool_id
+        self.name = name
+        self.tournament = tournament
+        self.state_url = state_url
+        self.shard = shard
+
+
+def check_id(kind, value):
+    # ids end up in file names and Redis keys
+    if not valid_id.match(value):
+        raise ValueError(f"{kind} id {value!r} may only contain letters, digits, _ and -")
+    return value
+
+def sources(config):
+    return [config["sheets_url"]] + list(config.get("live_sources", []))
+
+def load_pools(secrets):
+    # returns tournaments and pools by id, in the order they are configured
+    state_url = secrets.get("state_url", DB_PATH)
+    if "pools" not in secrets:
+        tournament = Tournament(DEFAULT, [secrets["public_gsheets_url"]] + list(secrets.get("live_sources", [])), state_url, None)
+        return {DEFAULT: tournament}, {DEFAULT: Pool(DEFAULT, DEFAULT, DEFAULT, state_url, None)}
+    tournaments = {}
+    for tournament_id, config in secrets["tournaments"].items():
+        check_id("tournament", tournament_id)
+        tournaments[tournament_id] = Tournament(tournament_id, sources(config), state_url, "tournament-" + tournament_id)
+    pools = {}
+    for pool_id, config in secrets["pools"].items():
+        check_id("pool", pool_id)
+        if pool_id.startswith("tournament-"):
+            raise ValueError(f"pool id {pool_id!r} would share a shard with a tournament")
+        if config["tournament"] not in tournaments:
+            raise ValueError(f"pool {pool_id!r} plays unknown tournament {config['tournament']!r}")
+        pools[pool_id] = Pool(pool_id, config.get("name", pool_id), config["tournament"], config.get("state_url", state_url), pool_id)
+    if not pools:
+        raise ValueError("the pools section lists no pools")
+    return tournaments, pools
+
+def pools_of(pools, tournament_id):
+    return [pool for pool in pools.values() if pool.tournament == tournament_id]
@@ -0,0 +1,388 @@
+import pickle as pkl
+import struct
+import threading
+from player_record import PlayerRecord, is_record, record_from_player
+from player_store import VersionConflict, decode_player
+from instrumentation import count, instrumented
+
+# Player store on a Redis server, for running several app processes behind
+# a load balancer. Same interface and semantics as PlayerStore: one hash per
+# player holding its data and version, a list keeping the order players
+# signed up in, per player scores and the leaderboard totals next to them.
+# Compare-and-swap goes through WATCH/MULTI, so a write based on a stale
+# read fails on every process, not just the one that made it.
+
+score_format = struct.Struct("<ddq")
+
+
+def text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class RedisPlayerStore:
+
+    def __init__(self, client, prefix="bracket:", pool=None):
+        # client is a redis.Redis or anything with the same commands, like
+        # LocalRedis below
+        self.client = client
+        self.prefix = prefix
+        self.pool = pool
+
+    def _key(self, *parts):
+        return self.prefix + ":".join(parts)
+
+    def get(self, name, default=None):
+        return self.get_versioned(name, default)[0]
+
+    @instrumented("store.get")
+    def get_versioned(self, name, default=None):
+        # version 0 means the player has never been stored
+        row = self.client.hgetall(self._key("player", name))
+        if not row:
+            return default, 0
+        count("store.rows_read")
+        return decode_player(name, row[b"data"]), int(row[b"version"])
+
+    @instrumented("store.put")
+    def put(self, name, player, expected_version=None):
+        data = player.to_bytes()
+        key = self._key("player", name)
+
+        def write(pipe):
+            version = pipe.hget(key, "version")
+            version = 0 if version is None else int(version)
+            if expected_version is not None and version != expected_version:
+                count("store.version_conflicts")
+                raise VersionConflict(name)
+            pipe.multi()
+            pipe.hset(key, mapping={"data": data, "version": version + 1})
+            if version == 0:
+                pipe.rpush(self._key("players"), name)
+            pipe.incr(self._key("revision"))
+            return version + 1
+
+        version = self.client.transaction(write, key, value_from_callable=True)
+        count("store.rows_written")
+        return version
+
+    def update(self, name, change, default=None, retries=10):
+        for _ in range(retries):
+            player, version = self.get_versioned(name)
+            if player is None:
+                player = PlayerRecord.from_bytes(name, default.to_bytes())
+            player = change(player)
+            try:
+                return player, self.put(name, player, expected_version=version)
+            except VersionConflict:
+                continue
+        raise VersionConflict(name)
+
+    @instrumented("store.write_batch")
+    def write_batch(self, writes):
+        # same as PlayerStore.write_batch, every write is its own
+        # transaction here and durability is up to the server's appendfsync
+        results = []
+        for name, change, default, expected_version in writes:
+            try:
+                player, version = self.get_versioned(name)
+                if player is None:
+                    player = PlayerRecord.from_bytes(name, default.to_bytes())
+                player = change(player)
+                results.append((player, self.put(name, player, expected_version=version if expected_version is None else expected_version)))
+            except VersionConflict as e:
+                if expected_version is not None:
+                    results.append(e)
+                    continue
+                results.append(self.update(name, change, default))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    @instrumented("store.put_many")
+    def put_many(self, players):
+        for name, player in players.items():
+            self.put(name, player)
+
+    def names(self):
+        return [text(name) for name in self.client.lrange(self._key("players"), 0, -1)]
+
+    def _rows(self, names):
+        pipe = self.client.pipeline(transaction=False)
+        for name in names:
+            pipe.hgetall(self._key("player", name))
+        return zip(names, pipe.execute())
+
+    @instrumented("store.iter")
+    def iter(self):
+        for name, row in self._rows(self.names()):
+            count("store.rows_read")
+            yield name, decode_player(name, row[b"data"])
+
+    @instrumented("store.iter")
+    def iter_versioned(self):
+        for name, row in self._rows(self.names()):
+            count("store.rows_read")
+            yield name, decode_player(name, row[b"data"]), int(row[b"version"])
+
+    def compact(self):
+        # players are always written as records here, only rows copied over
+        # from an old store can hold pickled dicts
+        legacy = [(name, row[b"data"]) for name, row in self._rows(self.names()) if not is_record(row[b"data"])]
+        for name, data in legacy:
+            self.client.hset(self._key("player", name), "data", record_from_player(name, pkl.loads(data)).to_bytes())
+        return len(legacy)
+
+    def get_meta(self, key, default=None):
+        value = self.client.hget(self._key("meta"), key)
+        if value is None:
+            return default
+        return pkl.loads(value)
+
+    def set_meta(self, key, value):
+        self.client.hset(self._key("meta"), key, pkl.dumps(value))
+
+    def update_meta(self, key, change, default=None):
+        # change gets the stored value (or default) and returns the new one,
+        # it runs again if somebody else wrote the meta in between
+        meta = self._key("meta")
+
+        def write(pipe):
+            value = pipe.hget(meta, key)
+            value = change(default if value is None else pkl.loads(value))
+            pipe.multi()
+            pipe.hset(meta, key, pkl.dumps(value))
+            return value
+
+        return self.client.transaction(write, meta, value_from_callable=True)
+
+    @instrumented("store.put_scores")
+    def put_scores(self, rows):
+        # rows are (name, match, bracket points, match points, player version),
+        # rows scored from an older version of a player are dropped. The
+        # totals of a player are summed up in the same transaction.
+        by_name = {}
+        for name, match, bracket, goals, version in rows:
+            by_name.setdefault(name, []).append((match, bracket, goals, version))
+        for name, player_rows in by_name.items():
+            key = self._key("scores", name)
+            counter = self._key("leaderboard", "counter")
+
+            def write(pipe):
+                # the counter is watched too, so changes land in seq order
+                seq = int(pipe.get(counter) or 0) + 1
+                stored = {int(match): score_format.unpack(value) for match, value in pipe.hgetall(key).items()}
+                for match, bracket, goals, version in player_rows:
+                    if match not in stored or version >= stored[match][2]:
+                        stored[match] = (bracket, goals, version)
+                pipe.multi()
+                pipe.hset(key, mapping={match: score_format.pack(*value) for match, value in stored.items()})
+                totals = (sum(v[0] for v in stored.values()), sum(v[1] for v in stored.values()))
+                pipe.hset(self._key("leaderboard"), name, struct.pack("<dd", *totals))
+                pipe.zadd(self._key("leaderboard", "seq"), {name: seq})
+                pipe.set(counter, seq)
+
+            self.client.transaction(write, key, counter)
+
+    @instrumented("store.leaderboard")
+    def leaderboard(self):
+        totals = self.client.hgetall(self._key("leaderboard"))
+        rows = []
+        for name in self.names():
+            value = totals.get(name.encode("utf-8"))
+            if value is not None:
+                rows.append((name,) + struct.unpack("<dd", value))
+        return rows
+
+    @instrumented("store.leaderboard_changes")
+    def leaderboard_changes(self, since=0):
+        # the leaderboard rows written after since, and the seq to pass next time
+        changed = self.client.zrangebyscore(self._key("leaderboard", "seq"), f"({since}", "+inf", withscores=True)
+        if not changed:
+            return [], since
+        pipe = self.client.pipeline(transaction=False)
+        for name, _ in changed:
+            pipe.hget(self._key("leaderboard"), name)
+        rows = [(text(name),) + struct.unpack("<dd", value) for (name, _), value in zip(changed, pipe.execute())]
+        return rows, int(changed[-1][1])
+
+    def append_history(self, data, after):
+        # appends entry after + 1, False if somebody else appended it first
+        key = self._key("history")
+
+        def append(pipe):
+            if pipe.llen(key) != after:
+                return False
+            pipe.multi()
+            pipe.rpush(key, data)
+            return True
+
+        return self.client.transaction(append, key, value_from_callable=True)
+
+    def history(self, since=0):
+        # (seq, data) of the entries after since, seq counts from 1
+        return list(enumerate(self.client.lrange(self._key("history"), since, -1), since + 1))
+
+    def __iter__(self):
+        return self.iter()
+
+    def revision(self):
+        # bumped by every write, so it only ever grows
+        return int(self.client.get(self._key("revision")) or 0)
+
+    def __contains__(self, name):
+        return bool(self.client.exists(self._key("player", name)))
+
+    def __len__(self):
+        return self.client.llen(self._key("players"))
+
+
+class WatchError(Exception):
+    pass
+
+
+class LocalRedis:
+    # In-process stand-in for a Redis server with the commands the store
+    # uses, for tests and single process runs without a server. Values come
+    # back as bytes like from redis-py.
+
+    def __init__(self):
+        self.data = {}
+        self.changes = {}
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _bytes(value):
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode("utf-8")
+
+    def _touch(self, key):
+        self.changes[key] = self.changes.get(key, 0) + 1
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = self._bytes(value)
+            self._touch(key)
+            return True
+
+    def incr(self, key):
+        with self.lock:
+            value = int(self.data.get(key, b"0")) + 1
+            self.data[key] = self._bytes(value)
+            self._touch(key)
+            return value
+
+    def exists(self, key):
+        with self.lock:
+            return int(key in self.data)
+
+    def hget(self, key, field):
+        with self.lock:
+            return self.data.get(key, {}).get(self._bytes(field))
+
+    def hgetall(self, key):
+        with self.lock:
+            return dict(self.data.get(key, {}))
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self.lock:
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            row = self.data.setdefault(key, {})
+            added = sum(self._bytes(f) not in row for f in items)
+            row.update({self._bytes(f): self._bytes(v) for f, v in items.items()})
+            self._touch(key)
+            return added
+
+    def rpush(self, key, *values):
+        with self.lock:
+            items = self.data.setdefault(key, [])
+            items.extend(self._bytes(v) for v in values)
+            self._touch(key)
+            return len(items)
+
+    def lrange(self, key, start, end):
+        with self.lock:
+            items = self.data.get(key, [])
+            return list(items[start:] if end == -1 else items[start:end + 1])
+
+    def llen(self, key):
+        with self.lock:
+            return len(self.data.get(key, []))
+
+    def zadd(self, key, mapping):
+        with self.lock:
+            scores = self.data.setdefault(key, {})
+            added = sum(self._bytes(member) not in scores for member in mapping)
+            scores.update({self._bytes(member): float(score) for member, score in mapping.items()})
+            self._touch(key)
+            return added
+
+    def zrangebyscore(self, key, low, high, withscores=False):
+        # bounds as in redis: a number, "(number" for exclusive or +inf/-inf
+        def bound(value):
+            value = str(value)
+            if value.startswith("("):
+                return float(value[1:]), True
+            return float(value), False
+        (low, low_open), (high, high_open) = bound(low), bound(high)
+        with self.lock:
+            members = sorted(self.data.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+        members = [(m, v) for m, v in members if (v > low if low_open else v >= low) and (v < high if high_open else v <= high)]
+        return members if withscores else [m for m, _ in members]
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        # like redis-py: func runs again whenever a watched key changed
+        # before the queued commands went through
+        while True:
+            pipe = self.pipeline()
+            try:
+                pipe.watch(*watches)
+                value = func(pipe)
+                results = pipe.execute()
+                return value if value_from_callable else results
+            except WatchError:
+                continue
+
+
+class LocalPipeline:
+
+    def __init__(self, client):
+        self.client = client
+        self.watched = None
+        self.queued = False
+        self.queue = []
+
+    def watch(self, *keys):
+        with self.client.lock:
+            self.watched = {key: self.client.changes.get(key, 0) for key in keys}
+
+    def multi(self):
+        self.queued = True
+        self.queue = []
+
+    def execute(self):
+        with self.client.lock:
+            for key, change in (self.watched or {}).items():
+                if self.client.changes.get(key, 0) != change:
+                    raise WatchError(key)
+            return [getattr(self.client, command)(*args, **kwargs) for command, args, kwargs in self.queue]
+
+    def __getattr__(self, command):
+        # in watch mode commands run right away, after multi() they queue up
+        method = getattr(self.client, command)
+
+        def call(*args, **kwargs):
+            if self.queued or self.watched is None:
+                self.queue.append((command, args, kwargs))
+                return self
+            return method(*args, **kwargs)
+        return call
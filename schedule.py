@@ -0,0 +1,141 @@
+import bisect
+import math
+import iso8601
+from teams import team_id, team_names
+from bracket import Bracket
+from instrumentation import instrumented
+
+# The live sheet parsed once per refresh: kickoffs as epoch seconds and
+# teams/winners as ids from teams.py (0 "Not Decided", winner -1 while open),
+# so the per player loops only compare numbers.
+
+
+class ScheduledMatch:
+    __slots__ = ("number", "team_a", "team_b", "winner", "goals_a", "goals_b", "done", "kickoff", "next_match", "next_team")
+
+    def __init__(self, number, team_a, team_b, winner, goals_a, goals_b, done, kickoff, next_match, next_team):
+        self.number = number
+        self.team_a = team_a
+        self.team_b = team_b
+        self.winner = winner
+        self.goals_a = goals_a
+        self.goals_b = goals_b
+        self.done = done
+        self.kickoff = kickoff
+        self.next_match = next_match
+        self.next_team = next_team
+
+    @property
+    def name_a(self):
+        return team_names[self.team_a]
+
+    @property
+    def name_b(self):
+        return team_names[self.team_b]
+
+    @property
+    def winner_name(self):
+        return "NONE" if self.winner == -1 else team_names[self.winner]
+
+    def started(self, now):
+        return self.kickoff < now
+
+
+class MatchLocked(Exception):
+    # a submit touched a match that already kicked off
+    def __init__(self, matches):
+        super().__init__(matches)
+        self.matches = matches
+
+
+class KickoffIndex:
+    # Kickoffs sorted once per schedule. A match is locked from its kickoff
+    # on, and the locked matches are always the first ones in kickoff
+    # order, so one bisect answers any question about them.
+
+    def __init__(self, matches):
+        self.order = sorted(range(len(matches)), key=lambda m: matches[m].kickoff)
+        self.times = [matches[m].kickoff for m in self.order]
+        self.rank = [0] * len(matches)
+        for rank, m in enumerate(self.order):
+            self.rank[m] = rank
+
+    def locked_count(self, now):
+        return bisect.bisect_left(self.times, now)
+
+    def locked(self, match, now):
+        return self.rank[match] < self.locked_count(now)
+
+    def locked_matches(self, now):
+        return self.order[:self.locked_count(now)]
+
+    def next_kickoff(self, now):
+        # the first kickoff that hasn't locked its match yet, None after the last
+        i = self.locked_count(now)
+        return self.times[i] if i < len(self.times) else None
+
+    def kicked_off(self, since, now):
+        return self.locked_count(now) > self.locked_count(since)
+
+    def check(self, matches, now):
+        locked = [m for m in matches if self.locked(m, now)]
+        if locked:
+            raise MatchLocked(locked)
+
+
+def goals_text(goals):
+    # 2.0 -> "2", empty cells stay "nan"
+    return f"{goals:g}"
+
+
+class Schedule:
+    __slots__ = ("matches", "bracket", "kickoffs")
+
+    def __init__(self, matches):
+        self.matches = matches
+        self.bracket = Bracket([m.next_match for m in matches], [m.next_team for m in matches])
+        self.kickoffs = KickoffIndex(matches)
+
+    def __len__(self):
+        return len(self.matches)
+
+    def __getitem__(self, number):
+        return self.matches[number]
+
+    def __iter__(self):
+        return iter(self.matches)
+
+    def started(self, now):
+        return [match.kickoff < now for match in self.matches]
+
+    def kicked_off(self, since, now):
+        # whether any match started in (since, now]
+        return self.kickoffs.kicked_off(since, now)
+
+
+def flag(value, column):
+    # a parsed bool, an empty cell is False. Text means the sheet wasn't
+    # parsed right and bool() would make any of it True.
+    if isinstance(value, str):
+        raise ValueError(f"{column} should be a bool, got {value!r}")
+    if isinstance(value, float) and math.isnan(value):
+        return False
+    return bool(value)
+
+@instrumented("feed.build_schedule")
+def build_schedule(live_data):
+    matches = []
+    for number, live_match in enumerate(live_data.values()):
+        matches.append(ScheduledMatch(
+            number,
+            team_id(live_match["TeamA"]),
+            team_id(live_match["TeamB"]),
+            -1 if live_match["winner"] == "NONE" else team_id(live_match["winner"]),
+            float(live_match["goalsA"]),
+            float(live_match["goalsB"]),
+            flag(live_match["done"], "done"),
+            iso8601.parse_date(live_match["datetime"]).timestamp(),
+            int(live_match["nextMatch"]),
+            live_match["nextTeam"],
+        ))
+    return Schedule(matches)
@@ -0,0 +1,103 @@
+import functools
+import time
+from teams import team_code, team_id
+from instrumentation import instrumented
+
+def get_status(match, scheduled, now):
+    # scheduled is a ScheduledMatch, now epoch seconds taken once per pass
+    done = (scheduled.winner != -1)
+    started = scheduled.kickoff < now
+    prediction = team_id(match["prediction"])
+    correct = scheduled.winner == prediction
+    predicted = (prediction != 0)
+
+    if started and not predicted:
+        return "NOT_VOTED"
+    if done and correct:
+        return "CORRECT"
+    if done and not correct:
+        return "INCORRECT"
+    else:
+        return "EMPTY"
+
+def update_player(player, schedule, now=None):
+    update_statuses(player, schedule, range(len(schedule)), now)
+
+def update_statuses(player, schedule, match_numbers, now=None):
+    if now is None:
+        now = time.time()
+    matches = player["matches"]
+    for match_number in match_numbers:
+        matches[match_number]["status"] = get_status(matches[match_number], schedule[match_number], now)
+
+@functools.lru_cache(maxsize=1024)
+def _bracket_weights(not_voted, children, order):
+    # one bottom-up pass, a match is worth the sum of what its two feeding
+    # matches are worth, a first round slot or a match that started
+    # without a prediction counts 1. Keyed by the NOT_VOTED pattern, which
+    # is the only player input the weights depend on, so most players share
+    # one entry.
+    weights = [0] * len(not_voted)
+    for match_number in order:
+        if not_voted[match_number]:
+            weights[match_number] = 1
+        else:
+            weights[match_number] = sum(weights[c] if c >= 0 else 1 for c in children[match_number])
+    return tuple(weights)
+
+def bracket_weights(player, bracket):
+    not_voted = tuple(m["status"] == "NOT_VOTED" for m in player["matches"].values())
+    return _bracket_weights(not_voted, bracket.children, bracket.order)
+
+def calculate_bracket_points(player, schedule, match_number):
+    if match_number < 0:
+        return 1
+    return bracket_weights(player, schedule.bracket)[match_number]
+
+
+@instrumented("scoring.calculate_points")
+def calculate_points(player, schedule, now=None):
+    points_overview = {"description":[], "match": [], "points": []}
+    update_player(player, schedule, now)
+    matches = player["matches"]
+    weights = bracket_weights(player, schedule.bracket)
+    double_dict = {}
+    points = 0
+    match_points = 0
+    for i, m, l_m in zip(matches.keys(), matches.values(), schedule):
+        if m["status"] == "CORRECT":
+            country = m["prediction"]
+            if country not in double_dict:
+                double_dict[country] = 1
+            point_cur = float(weights[int(i)])
+            double_dict[country] *= 2
+            points_overview["description"].append(f"Correctly predicted {country} ({team_code(country)}) win in: ")
+            points_overview["match"].append(f"{team_code(m['TeamA'])} vs {team_code(m['TeamB'])}")
+            points_overview["points"].append(point_cur)
+            #points_overview["points"].append(float(double_dict[country]))
+            # points_overview["match points"].append(float(calculate_points_s(m, l_m)))
+            # points_overview["total"].append(float(points_overview["bracket points"][-1]+points_overview["match points"][-1]))
+            points += point_cur
+        if "submitted" in m and m["submitted"]:
+            match_points += calculate_points_s(m, l_m)
+    return points, points_overview, match_points
+
+def calculate_points_s(match, scheduled):
+    if "submitted" in match and scheduled.done:
+        predGA= match["goalsAp"]
+        predGB = match["goalsBp"]
+        GA = scheduled.goals_a
+        GB = scheduled.goals_b
+        diff_a = predGA - GA
+        diff_b = predGB - GB
+        diff_pAB = predGA - predGB
+        diff_AB = GA - GB
+        if diff_a == 0 and diff_b == 0:
+            return 5
+        if diff_pAB == diff_AB:
+            return 4
+        if diff_AB > 0 and diff_pAB > 0:
+            return 3
+        if diff_AB < 0 and diff_pAB < 0:
+            return 3
+    return 0
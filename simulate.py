@@ -0,0 +1,210 @@
+import itertools
+import numpy as np
+from teams import team_ids, team_names
+from vector_scoring import bracket_weights, encode_players, match_points
+from instrumentation import instrumented
+
+# Chances to win: the open matches are played out many times, every
+# player is scored for each outcome and we count how often they end up
+# first or in the top 3. A team beats another with probability
+# proportional to its strength (all equal unless given) and goals follow a
+# Poisson distribution per team. Outcomes are one-hot encoded, so scoring
+# all players for a batch of outcomes is a single matrix product.
+
+max_goals = 7
+batch_elements = 1 << 22
+
+
+def team_array(values, default):
+    # per team id, from a dict keyed by team name
+    array = np.full(len(team_names), default, dtype=np.float64)
+    for name, value in (values or {}).items():
+        array[team_ids[name]] = value
+    return array
+
+def open_matches(schedule):
+    return [m for m in schedule.bracket.order if schedule[m].winner == -1]
+
+def play_bracket(schedule, strengths, uniforms):
+    # uniforms (outcomes x open matches) in [0, 1], team A wins an open match
+    # when its draw is below the win probability. Passing 0 or 1 plays a
+    # given side, which is how exact enumeration uses it.
+    bracket = schedule.bracket
+    count = len(uniforms)
+    team_a = np.empty((count, len(schedule)), dtype=np.int16)
+    team_b = np.empty((count, len(schedule)), dtype=np.int16)
+    winners = np.empty((count, len(schedule)), dtype=np.int16)
+    probability = np.ones(count)
+    column = {m: i for i, m in enumerate(open_matches(schedule))}
+    for m in bracket.order:
+        scheduled = schedule[m]
+        child_a, child_b = bracket.children[m]
+        team_a[:, m] = winners[:, child_a] if child_a >= 0 else scheduled.team_a
+        team_b[:, m] = winners[:, child_b] if child_b >= 0 else scheduled.team_b
+        if scheduled.winner != -1:
+            winners[:, m] = scheduled.winner
+            continue
+        strength_a = strengths[team_a[:, m]]
+        p = strength_a / (strength_a + strengths[team_b[:, m]])
+        a_wins = uniforms[:, column[m]] < p
+        winners[:, m] = np.where(a_wins, team_a[:, m], team_b[:, m])
+        probability *= np.where(a_wins, p, 1 - p)
+    return team_a, team_b, winners, probability
+
+def sample_goals(team_a, team_b, winners, goal_rates, rng):
+    # goals are capped at max_goals, a draw stands for a penalty shootout
+    goals_a = np.minimum(rng.poisson(goal_rates[team_a]), max_goals)
+    goals_b = np.minimum(rng.poisson(goal_rates[team_b]), max_goals)
+    swap = ((goals_a > goals_b) & (winners == team_b)) | ((goals_a < goals_b) & (winners == team_a))
+    return np.where(swap, goals_b, goals_a), np.where(swap, goals_a, goals_b)
+
+def candidates(schedule):
+    # teams that can still win each match
+    bracket = schedule.bracket
+    teams = {}
+    for m in bracket.order:
+        scheduled = schedule[m]
+        if scheduled.winner != -1:
+            teams[m] = [scheduled.winner]
+            continue
+        teams[m] = []
+        for child, team in zip(bracket.children[m], (scheduled.team_a, scheduled.team_b)):
+            teams[m] += teams[child] if child >= 0 else [team]
+    return teams
+
+def final_weights(players):
+    # at the end of the tournament every match has started, so a match
+    # without a prediction is NOT_VOTED for good
+    return players["prediction"] == 0
+
+def points_model(schedule, players, with_match_points):
+    # the player side of the product: one row per (open match, winner) and,
+    # with match points, per (open match, score), plus the points that are
+    # already settled
+    weights = bracket_weights(final_weights(players), schedule.bracket)
+    prediction = players["prediction"]
+    voted = prediction != 0
+    done = np.array([m.winner != -1 for m in schedule])
+    base = np.where(done & voted & (prediction == np.array([m.winner for m in schedule])), weights, 0.0).sum(axis=1)
+    if with_match_points:
+        live = {"goalsA": np.array([m.goals_a for m in schedule]), "goalsB": np.array([m.goals_b for m in schedule]), "done": done}
+        base += match_points(players, live).sum(axis=1)
+
+    teams = candidates(schedule)
+    rows, lookups, goal_matches = [], {}, []
+    for m in open_matches(schedule):
+        lookup = np.full(len(team_names), -1)
+        lookup[teams[m]] = np.arange(len(teams[m])) + len(rows)
+        lookups[m] = lookup
+        for team in teams[m]:
+            rows.append(np.where(voted[:, m] & (prediction[:, m] == team), weights[:, m], 0.0))
+    if with_match_points:
+        size = max_goals + 1
+        pairs = np.arange(size * size)
+        live = {"goalsA": (pairs // size)[:, None].astype(np.float64), "goalsB": (pairs % size)[:, None].astype(np.float64), "done": np.ones((size * size, 1), dtype=bool)}
+        for m in open_matches(schedule):
+            if not players["submitted"][:, m].any():
+                continue
+            match = {key: players[key][:, m][None, :] for key in ("goalsAp", "goalsBp", "submitted")}
+            goal_matches.append((m, len(rows)))
+            rows.extend(match_points(match, live))
+    model = np.array(rows, dtype=np.float32).reshape(len(rows), len(prediction))
+    return base, model, lookups, goal_matches
+
+def outcome_codes(winners, goals, lookups, goal_matches):
+    # the model rows that are hot for every outcome
+    codes = [lookups[m][winners[:, m]] for m in lookups]
+    if goals is not None:
+        goals_a, goals_b = goals
+        codes += [offset + goals_a[:, m] * (max_goals + 1) + goals_b[:, m] for m, offset in goal_matches]
+    return np.stack(codes, axis=1) if codes else np.zeros((len(winners), 0), dtype=np.int64)
+
+def rank_outcomes(codes, weights, base, model):
+    # weighted share of outcomes each player finishes first / in the top 3,
+    # ties count for everybody tied
+    num_players = len(base)
+    first = np.zeros(num_players)
+    top3 = np.zeros(num_players)
+    batch = max(1, batch_elements // max(num_players, model.shape[0], 1))
+    for start in range(0, len(codes), batch):
+        chunk = codes[start:start + batch]
+        hot = np.zeros((len(chunk), model.shape[0]), dtype=np.float32)
+        np.put_along_axis(hot, chunk, 1.0, axis=1)
+        totals = hot @ model + base.astype(np.float32)
+        w = weights[start:start + batch, None]
+        first += (w * (totals == totals.max(axis=1, keepdims=True))).sum(axis=0)
+        third = np.partition(totals, -3, axis=1)[:, -3:-2] if num_players >= 3 else totals.min(axis=1, keepdims=True)
+        top3 += (w * (totals >= third)).sum(axis=0)
+    return first, top3
+
+def max_bracket_points(schedule, players):
+    # most bracket points each player can still reach: for every match and
+    # every team that can still win it, the best a player can score in that
+    # part of the bracket
+    bracket = schedule.bracket
+    weights = bracket_weights(final_weights(players), bracket)
+    prediction = players["prediction"]
+    zero = np.zeros(len(prediction))
+    best = {}
+    for m in bracket.order:
+        scheduled = schedule[m]
+        sides = []
+        for child, team in zip(bracket.children[m], (scheduled.team_a, scheduled.team_b)):
+            sides.append(best[child] if child >= 0 else {team: zero})
+        options = {}
+        for side, other in ((sides[0], sides[1]), (sides[1], sides[0])):
+            other_best = np.max(list(other.values()), axis=0)
+            for team, points in side.items():
+                if scheduled.winner != -1 and team != scheduled.winner:
+                    continue
+                hit = (prediction[:, m] == team) & (prediction[:, m] != 0)
+                options[team] = np.maximum(options.get(team, zero), points + other_best + np.where(hit, weights[:, m], 0.0))
+        if not options:
+            # the sheet does not agree with itself, score the winner alone
+            hit = (prediction[:, m] == scheduled.winner) & (prediction[:, m] != 0)
+            options[scheduled.winner] = np.where(hit, weights[:, m], 0.0)
+        best[m] = options
+    roots = [m for m in bracket.order if bracket.parent[m] == -1]
+    return sum(np.max(list(best[m].values()), axis=0) for m in roots)
+
+def max_match_points(schedule, players):
+    # settled match points plus 5 for every submitted score still open
+    done = np.array([m.winner != -1 for m in schedule])
+    live = {"goalsA": np.array([m.goals_a for m in schedule]), "goalsB": np.array([m.goals_b for m in schedule]), "done": done}
+    return match_points(players, live).sum(axis=1) + 5.0 * (players["submitted"] & ~done).sum(axis=1)
+
+@instrumented("chances.simulate")
+def simulate(schedule, records, simulations=100000, strengths=None, goal_rates=None, with_match_points=False, seed=None):
+    # records are PlayerRecords, returns names and per player arrays
+    records = list(records)
+    players = encode_players(records)
+    strengths = team_array(strengths, 1.0)
+    goal_rates = team_array(goal_rates, 1.3)
+    rng = np.random.default_rng(seed)
+    base, model, lookups, goal_matches = points_model(schedule, players, with_match_points)
+    uniforms = rng.random((simulations, len(lookups)))
+    team_a, team_b, winners, _ = play_bracket(schedule, strengths, uniforms)
+    goals = sample_goals(team_a, team_b, winners, goal_rates, rng) if with_match_points else None
+    codes = outcome_codes(winners, goals, lookups, goal_matches)
+    # many simulations end the same way, each outcome is scored once
+    codes, counts = np.unique(codes, axis=0, return_counts=True)
+    first, top3 = rank_outcomes(codes, counts / simulations, base, model)
+    max_points = max_bracket_points(schedule, players)
+    if with_match_points:
+        max_points = max_points + max_match_points(schedule, players)
+    return {"names": [r.name for r in records], "first": first, "top3": top3, "max_points": max_points}
+
+def exact_chances(schedule, records, strengths=None, max_outcomes=1 << 20):
+    # every way the open matches can go, bracket points only
+    records = list(records)
+    players = encode_players(records)
+    strengths = team_array(strengths, 1.0)
+    if (strengths <= 0).any():
+        raise ValueError("team strengths must be positive")
+    base, model, lookups, goal_matches = points_model(schedule, players, False)
+    if 2 ** len(lookups) > max_outcomes:
+        raise ValueError(f"{2 ** len(lookups)} outcomes to enumerate, more than {max_outcomes}")
+    sides = np.array(list(itertools.product((0.0, 1.0), repeat=len(lookups)))).reshape(-1, len(lookups))
+    _, _, winners, probability = play_bracket(schedule, strengths, sides)
+    first, top3 = rank_outcomes(outcome_codes(winners, None, lookups, goal_matches), probability, base, model)
+    return {"names": [r.name for r in records], "first": first, "top3": top3, "max_points": max_bracket_points(schedule, players)}
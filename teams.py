@@ -0,0 +1,69 @@
+import threading
+
+country_codes = {
+    "Switzerland": "SUI",
+    "Spain": "ESP",
+    "Netherlands": "NED",
+    "South Africa": "ZAF",
+    "Japan": "JPN",
+    "Norway": "NOR",
+    "Sweden": "SWE",
+    "United States": "USA",
+    "Australia": "AUS",
+    "Denmark": "DEN",
+    "France": "FRA",
+    "Morocco": "MAR",
+    "England": "ENG",
+    "Nigeria": "NGA",
+    "Columbia": "COL",
+    "Colombia": "COL",
+    "Jamaica": "JAM",
+    "Not Decided": "___"
+}
+
+def team_code(name):
+    # three letters for a team, made up from the name for teams of other
+    # tournaments than the one country_codes lists
+    return country_codes.get(name, name[:3].upper())
+
+# integer ids for the teams, 0 is "Not Decided". Stored players keep these
+# ids, so new teams only ever go at the end of country_codes. Teams of other
+# tournaments get the ids after them, in the order they are listed in the
+# store (see sync_teams) so that every process and restart agrees on them.
+team_names = ["Not Decided"] + [name for name in country_codes if name != "Not Decided"]
+team_ids = {name: i for i, name in enumerate(team_names)}
+fixed_teams = len(team_names)
+synced = set(team_names)
+_lock = threading.Lock()
+
+def team_id(name):
+    # unknown teams get the next free id in this process only, call
+    # sync_teams first for teams that end up in stored players
+    with _lock:
+        if name not in team_ids:
+            team_ids[name] = len(team_names)
+            team_names.append(name)
+        return team_ids[name]
+
+def sync_teams(store, names=()):
+    # adds the names missing from the team list in store and takes over the
+    # ids of everything listed there
+    names = [name for name in dict.fromkeys(names) if name not in synced]
+    if not names:
+        return
+
+    def add(stored):
+        known = set(stored)
+        return list(stored) + [name for name in names if name not in known]
+    stored = store.update_meta("teams", add, [])
+    with _lock:
+        for i, name in enumerate(stored, fixed_teams):
+            if i < len(team_names):
+                if team_names[i] != name:
+                    raise RuntimeError(f"team {i} is {team_names[i]!r} here but {name!r} in the store")
+                continue
+            if name in team_ids:
+                raise RuntimeError(f"team {name!r} is {team_ids[name]} here but {i} in the store")
+            team_ids[name] = i
+            team_names.append(name)
+        synced.update(stored)
@@ -1,173 +1,325 @@
 import streamlit as st
 import streamlit.components.v1 as components
-from datetime import datetime
 import copy
-import json
-import pandas as pd
-from pprint import pprint
-import pickle as pkl
-import iso8601
-from dateutil import tz
-local_tz = tz.tzlocal()
-
-green = "#90EE90"
-red = "#FF7377"
-grey = "#cfc9c4"
-blue = "#ECECFD"
-
-def mermaid(code: str) -> None:
-    components.html(
-        f"""
-        <pre class="mermaid">
-            {code}
-        </pre>
-
-        <script type="module">
-            import mermaid from 'https://cdn.jsdelivr.net/npm/mermaid@10/dist/mermaid.esm.min.mjs';
-            mermaid.initialize({{ startOnLoad: true }});
-        </script>
-        """, height=250
-    )
-
-country_codes = {
-    "Switzerland": "SUI",
-    "Spain": "ESP",
-    "Netherlands": "NED",
-    "South Africa": "ZAF",
-    "Japan": "JPN",
-    "Norway": "NOR",
-    "Sweden": "SWE",
-    "United States": "USA",
-    "Australia": "AUS",
-    "Denmark": "DEN",
-    "France": "FRA",
-    "Morocco": "MAR",
-    "England": "ENG",
-    "Nigeria": "NGA",
-    "Columbia": "COL",
-    "Colombia": "COL",
-    "Jamaica": "JAM",
-    "Not Decided": "___"
-}
-
-def load_data(sheets_url):
-    csv_url = sheets_url.replace("/edit#gid=", "/export?format=csv&gid=")
-    return pd.read_csv(csv_url)
-
-
-@st.cache_data(ttl=60)
-def load_live_data():
-    df = load_data(st.secrets["public_gsheets_url"])
-    df_transpose = df.transpose(copy=True)
-    dic_inv = df_transpose.to_dict()
-    return dic_inv
-
-def load_players():
-    try:
-        with open('player_states.pkl', 'rb') as f:
-            players = pkl.load(f)
-        return players
-    except FileNotFoundError:
-        players = {}
-        return players
+import time
+import traceback
+from concurrent.futures import TimeoutError as SubmitTimeout
+from player_store import VersionConflict, migrate_pickle, open_store
+from pools import load_pools, pools_of
+import scoring
+from leaderboard import RankIndex, refresh_leaderboard, score_rows
+from history import History
+from live_feed import KickoffClock, LiveFeed, event_matches
+from write_queue import SubmitQueue
+from background import Latest
+from schedule import MatchLocked
+from bracket_svg import bracket_layout, bracket_node, player_nodes, render_bracket
+from picks import apply_choice, open_matches, propagate_picks, update_open
+from player_record import new_record, player_from_record, record_from_player
+import instrumentation
+from instrumentation import timer
+
+# pandas, numpy and the simulations are only imported by the functions that
+# need them, most reruns never get there
+
+if st.secrets.get("metrics", False):
+    instrumentation.enable()
+
+def is_admin(args):
+    # ?admin=<admin_token from the secrets> in the url, like the admin view
+    admin_token = st.secrets.get("admin_token")
+    return bool(admin_token) and args.get("admin", [None])[0] == admin_token
+
+def begin_page(page):
+    # call first thing on a page, end_page last: the rerun in between is
+    # timed, and with ?profile=1 next to the admin token in the url this
+    # session's reruns also run under cProfile
+    instrumentation.end_run()
+    args = st.experimental_get_query_params()
+    if "profile" in args and is_admin(args):
+        st.session_state["profile"] = args["profile"][0] not in ("", "0")
+    instrumentation.start_run(page, profile=st.session_state.get("profile", False))
+    select_pool(args.get("pool", [None])[0])
+
+# what a session keeps about its player, all of it belongs to one pool
+pool_session_keys = ("username", "player", "player_version", "schedule", "bracket_nodes", "status_checked", "open_matches", "dirty", "submit_error")
+
+def select_pool(requested=None):
+    # the pool picker in the sidebar, ?pool=<id> in the url preselects it
+    tournaments, pools = get_pools()
+    if requested in pools and "pool" not in st.session_state:
+        st.session_state["pool"] = requested
+    if st.session_state.get("pool") not in pools:
+        st.session_state["pool"] = next(iter(pools))
+    if len(pools) > 1:
+        st.sidebar.selectbox("Pool", list(pools), key="pool", format_func=lambda pool_id: pools[pool_id].name)
+    if st.session_state.get("session_pool") != st.session_state["pool"]:
+        for key in pool_session_keys:
+            st.session_state.pop(key, None)
+        st.session_state["session_pool"] = st.session_state["pool"]
+
+def current_pool():
+    tournaments, pools = get_pools()
+    return pools[st.session_state.get("pool", next(iter(pools)))]
+
+@st.cache_resource
+def get_pools():
+    return load_pools(st.secrets)
+
+def end_page():
+    run = instrumentation.end_run()
+    if run is None or not st.session_state.get("profile", False):
+        return
+    import pandas as pd
+    with st.expander(f"This rerun took {run.seconds * 1000:.0f}ms"):
+        breakdown = sorted(run.breakdown.items(), key=lambda item: -item[1][1])
+        st.dataframe(pd.DataFrame({
+            "timer": [name for name, _ in breakdown],
+            "calls": [calls for _, (calls, _) in breakdown],
+            "ms": [seconds * 1000 for _, (_, seconds) in breakdown],
+        }), use_container_width=True, hide_index=True)
+        st.write(f"profile written to {run.profile_path}")
+
+def display_admin():
+    # latencies of this process, see instrumentation.py
+    st.write("## Instrumentation")
+    on = st.checkbox("collect timings", value=instrumentation.enabled)
+    if on != instrumentation.enabled:
+        instrumentation.enable(on)
+    st.session_state["profile"] = st.checkbox("profile my reruns with cProfile", value=st.session_state.get("profile", False))
+    if st.button("reset"):
+        instrumentation.reset()
+    rows = instrumentation.summary()
+    import pandas as pd
+    st.dataframe(pd.DataFrame({
+        "timer": [r["name"] for r in rows],
+        "calls": [r["calls"] for r in rows],
+        "total s": [r["total"] for r in rows],
+        "p50 ms": [r["p50"] * 1000 for r in rows],
+        "p95 ms": [r["p95"] * 1000 for r in rows],
+        "p99 ms": [r["p99"] * 1000 for r in rows],
+    }), use_container_width=True, hide_index=True)
+    counters = instrumentation.counters()
+    if counters:
+        st.write("### Counters")
+        st.dataframe(pd.DataFrame({"counter": list(counters), "count": list(counters.values())}), use_container_width=True, hide_index=True)
+    st.write("### Recent reruns")
+    for run in sorted(instrumentation.recent_runs(), key=lambda run: -run.started)[:20]:
+        top = sorted(run.breakdown.items(), key=lambda item: -item[1][1])[:5]
+        parts = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, (_, seconds) in top)
+        st.write(f"{time.strftime('%H:%M:%S', time.localtime(run.started))} {run.page} {run.seconds * 1000:.0f}ms: {parts}")
+
+def get_live_feed():
+    return get_tournament_feed(current_pool().tournament)
+
+@st.cache_resource
+def get_tournament_feed(tournament_id):
+    # one feed per tournament, fetched once however many pools play it
+    tournaments, pools = get_pools()
+    tournament = tournaments[tournament_id]
+    stores = [(get_pool_store(pool.pool_id), get_pool_history(pool.pool_id)) for pool in pools_of(pools, tournament_id)]
+    # team ids are shared by every tournament, so their list lives in the
+    # default shard
+    feed = LiveFeed(tournament.sources, interval=60, shared=open_shard(tournament.state_url, tournament.shard), teams=open_shard(tournament.state_url, None))
+
+    def rescore(schedule, matches):
+        if matches is not None and not matches:
+            return
+        for store, history in stores:
+            refresh_leaderboard(store, schedule, matches=matches)
+            # the standings after every result, see history.py
+            history.record(store, schedule)
+    # rescore the matches the events name as soon as a new result comes in
+    # instead of on the next leaderboard view
+    feed.subscribe(lambda events, schedule: rescore(schedule, event_matches(events)))
+    # and the locked ones right at every kickoff, when missing picks turn
+    # NOT_VOTED
+    clock = KickoffClock(feed)
+    clock.subscribe(lambda locked, schedule: rescore(schedule, set(locked)))
+    feed.start()
+    clock.start()
+    return feed
+
+def load_schedule():
+    return get_live_feed().get_schedule()
+
+def get_store():
+    return get_pool_store(current_pool().pool_id)
+
+def get_pool_store(pool_id):
+    pools = get_pools()[1]
+    pool = pools[pool_id]
+    store = open_shard(pool.state_url, pool.shard)
+    if pool_id == next(iter(pools)):
+        # the players of the old pickle go to the pool pages open with, not
+        # to the default shard, which no pool reads once pools are set up
+        migrate_pickle(store)
+    return store
+
+@st.cache_resource
+def open_shard(url, shard):
+    # state_url points every app process at the same store, see open_store
+    store = open_store(url, shard)
+    store.compact()
+    return store
+
+def get_rank_index():
+    return get_pool_rank_index(current_pool().pool_id)
+
+@st.cache_resource
+def get_pool_rank_index(pool_id):
+    # one per pool and process, every view syncs it with the store first
+    return RankIndex()
+
+def get_history():
+    return get_pool_history(current_pool().pool_id)
+
+@st.cache_resource
+def get_pool_history(pool_id):
+    # like the rank index, views sync it with the store first
+    return History()
+
+def get_submit_queue():
+    return get_pool_submit_queue(current_pool().pool_id)
+
+@st.cache_resource
+def get_pool_submit_queue(pool_id):
+    store = get_pool_store(pool_id)
+    feed = get_tournament_feed(get_pools()[1][pool_id].tournament)
+
+    def score(committed):
+        # the whole batch is scored at once, before the submits return
+        names, players, versions = zip(*committed)
+        store.put_scores(score_rows(names, players, versions, feed.get_schedule()))
+    return SubmitQueue(store, on_commit=score).start()
+
+@st.cache_data(max_entries=4)
+def get_chances(key, simulations=20000):
+    # key is export.export_key, the chances only change with the players
+    # or the results
+    from simulate import simulate
+    store = get_store()
+    result = simulate(load_schedule(), (record for _, record in store.iter()), simulations)
+    return {name: (float(first), float(top3), float(max_points)) for name, first, top3, max_points in zip(result["names"], result["first"], result["top3"], result["max_points"])}
+
+def get_elimination(key):
+    # key is export.export_key, like get_chances: who can still finish first
+    # and one outcome that gets them there, None for can still win when the
+    # search couldn't settle it. The search can take seconds on a big pool,
+    # so it runs in the background and this is the last finished result,
+    # None before the first one.
+    return get_pool_elimination(current_pool().pool_id).get(key)[0]
+
+@st.cache_resource
+def get_pool_elimination(pool_id):
+    store = get_pool_store(pool_id)
+    feed = get_tournament_feed(get_pools()[1][pool_id].tournament)
+
+    def compute(key):
+        from elimination import analyze
+        # players still open after a minute show up as undecided
+        result = analyze(feed.get_schedule(), (record for _, record in store.iter()), time_limit=60)
+        return {name: (None if undecided else bool(alive), result["witness"].get(name))
+                for name, alive, undecided in zip(result["names"], result["alive"], result["undecided"])}
+    return Latest(compute, name=f"elimination-{pool_id}")
+
+def get_required_results(key, name, witness):
+    # (done, results): like get_elimination in the background, done is
+    # False until the results for this player and key are in, results are
+    # None when the search couldn't settle them
+    key = (key, name, tuple(witness))
+    required, computed = get_pool_required_results(current_pool().pool_id).get(key)
+    return computed == key, required
+
+@st.cache_resource
+def get_pool_required_results(pool_id):
+    store = get_pool_store(pool_id)
+    feed = get_tournament_feed(get_pools()[1][pool_id].tournament)
+
+    def compute(key):
+        from elimination import required_results
+        _, name, witness = key
+        return required_results(feed.get_schedule(), (record for _, record in store.iter()), name, list(witness), time_limit=20)
+    return Latest(compute, name=f"required-results-{pool_id}")
 
 
 def new_player(username):
-    player = {"name": username, "matches": None, "submitted": False}
-    matches = copy.deepcopy(st.session_state["live_data"])
-    for key, temp in matches.items():
-        temp["datetime"] = iso8601.parse_date(temp["datetime"])
-        temp["status"] = "EMPTY"
-    player["matches"] = matches
-    return player
+    schedule = st.session_state["schedule"]
+    return player_from_record(new_record(username, schedule), schedule)
 
 def get_player(username):
-    players = load_players()
-    if username in players:
-        return players[username]
-    else:
-        return new_player(username)
-
-def get_status(match, live_match):
-    winner = live_match["winner"]
-    done = (winner != "NONE")
-    time = iso8601.parse_date(live_match["datetime"])
-    started = (time < datetime.now(local_tz))
-    correct = winner == match["prediction"]
-    predicted = (match["prediction"] !="Not Decided")
-
-    if started and not predicted:
-        return "NOT_VOTED"
-    if done and correct:
-        return "CORRECT"
-    if done and not correct:
-        return "INCORRECT"
-    else:
-        return "EMPTY"
+    record, version = get_store().get_versioned(username)
+    if record is None:
+        return new_player(username), version
+    player = player_from_record(record, st.session_state["schedule"])
+    propagate_picks(player["matches"], st.session_state["schedule"].bracket)
+    return player, version
 
 def update_player():
-    matches = st.session_state["player"]["matches"]
-    live_data = st.session_state["live_data"]
-    for match, live_match in zip(matches.values(), live_data.values()):
-        match["status"] = get_status(match, live_match)
-
-def mermaid_string(key, match, live_match):
-    teamA = country_codes[match["TeamA"]]
-    teamB = country_codes[match["TeamB"]]
-    if match["prediction"] == match["TeamA"]:
-        teamA = "<b><u>"+ teamA + "</u></b>"
-    if match["prediction"] == match["TeamB"]:
-        teamB = "<b><u>"+ teamB + "</u></b>"
-
-    info = "<br>" + country_codes[live_match["TeamA"]] + " " + str(live_match["goalsA"]) +  " : " + str(live_match["goalsB"]) + " "+ country_codes[live_match["TeamB"]]
-    if match["status"]=="EMPTY":
-        info = ""
-    string = f"M{key}[{teamA + ' vs ' + teamB + '<small>' + info + '</small>'}] --> M{match['nextMatch']}\n"
-    if match['nextMatch'] == 0:
-        string = f"M{key}[{teamA + ' vs ' + teamB + info}]\n"
-    return string
-
-def get_style(key, match):
-    color = blue
-    if match["status"] == "CORRECT":
-        color = green
-    if match["status"] == "INCORRECT":
-        color = red
-    if match["status"] == "NOT_VOTED":
-        color = grey
-    string = f"style M{key} fill:{color},stroke:#8E72D4\n"
-    return string
-
-def display_player_bracket(player):
-    matches = player["matches"]
-    live_matches = st.session_state["live_data"]
-    string = "graph TD\n"
-    for key, match in matches.items():
-        string += mermaid_string(key, match, live_matches[key])
-        string += get_style(key, match)
-    mermaid(string)
+    # statuses only change with a new schedule, another player or a kickoff,
+    # picks made in between are handled match by match in mark_dirty. A new
+    # schedule only redoes the matches the feed's events name.
+    player = st.session_state["player"]
+    schedule = st.session_state["schedule"]
+    now = time.time()
+    checked = st.session_state.get("status_checked")
+    changed = None
+    if checked is not None and checked[1] is player:
+        changed = set() if checked[0] is schedule else get_live_feed().changed_since(checked[0])
+    if changed is not None and schedule.kicked_off(checked[2], now):
+        changed.update(m for m in schedule.kickoffs.locked_matches(now) if schedule[m].kickoff >= checked[2])
+    if changed is None:
+        scoring.update_player(player, schedule, now)
+        st.session_state["open_matches"] = open_matches(player["matches"])
+        st.session_state["dirty"] = None
+    elif changed:
+        mark_dirty(changed)
+    st.session_state["status_checked"] = (schedule, player, now)
+
+def mark_dirty(dirty):
+    player = st.session_state["player"]
+    scoring.update_statuses(player, st.session_state["schedule"], dirty)
+    update_open(st.session_state["open_matches"], player["matches"], dirty)
+    if st.session_state.get("dirty") is not None:
+        st.session_state["dirty"] |= dirty
+
+def render(nodes, schedule):
+    # render_bracket is cached on the nodes, count how often that pays off
+    misses = render_bracket.cache_info().misses
+    with timer("render.bracket"):
+        svg, height = render_bracket(nodes, bracket_layout(schedule.bracket))
+    instrumentation.count("render.cache_miss" if render_bracket.cache_info().misses != misses else "render.cache_hit")
+    return svg, height
+
+def display_player_bracket(player, show_teams=False):
+    schedule = st.session_state["schedule"]
+    svg, height = render(player_nodes(player, schedule, show_teams), schedule)
+    components.html(f'<div style="overflow-x: auto">{svg}</div>', height=height + 20)
+
+def display_session_bracket():
+    # the session player's bracket, rebuilding only the nodes of matches
+    # changed since the last run
+    player = st.session_state["player"]
+    schedule = st.session_state["schedule"]
+    nodes = st.session_state.get("bracket_nodes")
+    dirty = st.session_state.get("dirty")
+    if nodes is None or dirty is None:
+        nodes = [bracket_node(key, match, schedule[key]) for key, match in player["matches"].items()]
+    else:
+        for key in dirty:
+            nodes[key] = bracket_node(key, player["matches"][key], schedule[key])
+    st.session_state["bracket_nodes"] = nodes
+    st.session_state["dirty"] = set()
+    svg, height = render(tuple(nodes), schedule)
+    components.html(f'<div style="overflow-x: auto">{svg}</div>', height=height + 20)
 
 def process_choice(index):
-    matches = st.session_state["player"]["matches"]
-    match = matches[index]
     choice = st.session_state[f"selectbox_{index}"]
-
     if choice == "Select a Team":
         choice = "Not Decided"
-    if match["prediction"] != "Not Decided" and match["nextMatch"] != 0:
-
-        old_team = match["prediction"]
-        current_match = match
-        next_match = matches[current_match["nextMatch"]]
-        next_match[current_match["nextTeam"]] = choice
-        while (next_match["prediction"] == old_team) and (next_match["nextMatch"]!=0):
-            next_match["prediction"] = choice
-            current_match = next_match
-            next_match = matches[current_match["nextMatch"]]
-            next_match[current_match["nextTeam"]] = choice
-    match["prediction"] = choice
-    if match["nextMatch"] != 0:
-        matches[match["nextMatch"]][match["nextTeam"]] = choice
+    dirty = apply_choice(st.session_state["player"]["matches"], st.session_state["schedule"].bracket, index, choice)
+    mark_dirty(dirty)
+
 def display_match(index):
     matches = st.session_state["player"]["matches"]
     match = matches[index]
@@ -184,6 +336,7 @@ def display_match(index):
             selection_index = answers.index(match["prediction"])
         else:
             match["prediction"] = "Not Decided"
+            mark_dirty({index})
 
 
     prompt = f"Who will win, {match['TeamA']} or {match['TeamB']}?"
@@ -192,39 +345,90 @@ def display_match(index):
 
 
 def display_player_form(thing):
-    st.write("### Round of 16:")
-    for i in range(8):
-        display_match(i)
-    st.write("### Quarterfinal:")
-    for i in range(8, 12):
-        display_match(i)
-    st.write("### Semifinal:")
-    for i in range(12, 14):
-        display_match(i)
-    st.write("### Final:")
-    display_match(14)
+    bracket = st.session_state["schedule"].bracket
+    for round_number, round_matches in enumerate(bracket.rounds):
+        st.write(f"### {bracket.round_name(round_number)}:")
+        for i in round_matches:
+            display_match(i)
 
 
-def can_submit():
-    res = False
-    matches = st.session_state["player"]["matches"]
-    for m in matches.values():
-        if m["prediction"] == "Not Decided" and m["status"]!= 'NOT_VOTED':
-            res = True
-    if st.session_state["player"]["submitted"] == True:
-        res = True
-    return res
+# how long a submit waits for the writer before telling the user, the write
+# itself can still go through afterwards
+submit_timeout = 30
+slow_submit = "Saving took too long and may not have gone through, please reload the page in a moment and check."
+failed_submit = "Saving failed, nothing was changed. Please try again."
 
-def save_state(players):
-    with open('player_states.pkl', 'wb') as f:
-        pkl.dump(players, f)
+def can_submit():
+    # True disables the submit button: picks are missing or already submitted
+    return len(st.session_state["open_matches"]) > 0 or st.session_state["player"]["submitted"] == True
 
 def submit_player_data():
-    players = load_players()
-    st.session_state["player"]["submitted"] = True
-    players[st.session_state["username"]] = st.session_state["player"]
-    save_state(players)
+    username = st.session_state["username"]
+    player = copy.deepcopy(st.session_state["player"])
+    player["submitted"] = True
+    record = record_from_player(username, player)
+    # the deadline is checked against the time the submit came in and the
+    # current schedule, not whatever this session rendered
+    now = time.time()
+    schedule = load_schedule()
+
+    def change(stored):
+        changed = [m for m in schedule.kickoffs.locked_matches(now) if stored.prediction[m] != record.prediction[m]]
+        if changed:
+            raise MatchLocked(changed)
+        return record
+    try:
+        # returns once the submit is on disk
+        _, st.session_state["player_version"] = get_submit_queue().submit(username, change, default=new_record(username, schedule), expected_version=st.session_state["player_version"]).result(timeout=submit_timeout)
+        st.session_state["player"] = player
+    except SubmitTimeout:
+        st.session_state["submit_error"] = slow_submit
+    except VersionConflict:
+        st.session_state["player"], st.session_state["player_version"] = get_player(username)
+        st.session_state["submit_error"] = "Your predictions were changed somewhere else in the meantime, please check them and submit again."
+    except MatchLocked as e:
+        # picks for matches that started can't go in anymore
+        matches = st.session_state["player"]["matches"]
+        for m in e.matches:
+            matches[m]["prediction"] = "Not Decided"
+        propagate_picks(matches, schedule.bracket)
+        st.session_state["status_checked"] = None
+        st.session_state["submit_error"] = "Some matches started before you submitted, their picks were cleared. Please check your bracket and submit again."
+    except Exception:
+        traceback.print_exc()
+        st.session_state["submit_error"] = failed_submit
+
+def submit_match_prediction(index, goals_a, goals_b):
+    username = st.session_state["username"]
+    try:
+        load_schedule().kickoffs.check([index], time.time())
+    except MatchLocked:
+        st.session_state["submit_error"] = "This match already started, the prediction was not saved."
+        return
+    # the session's player only changes once the write went through
+    player = copy.deepcopy(st.session_state["player"])
+    match = player["matches"][index]
+    match["goalsAp"] = goals_a
+    match["goalsBp"] = goals_b
+    match["submitted"] = True
+
+    def change(record):
+        record.goals_a[index] = goals_a
+        record.goals_b[index] = goals_b
+        record.match_submitted[index] = 1
+        return record
+    # only this match is merged into the stored player, so a submit from
+    # another window for a different match is kept
+    default = record_from_player(username, player)
+    try:
+        _, st.session_state["player_version"] = get_submit_queue().submit(username, change, default=default).result(timeout=submit_timeout)
+        st.session_state["player"] = player
+    except SubmitTimeout:
+        st.session_state["submit_error"] = slow_submit
+    except Exception:
+        traceback.print_exc()
+        st.session_state["submit_error"] = failed_submit
 
 def process_username():
-    st.session_state["live_data"] = load_live_data()
-    st.session_state["player"] = get_player(st.session_state["username"])
\ No newline at end of file
+    st.session_state["schedule"] = load_schedule()
+    st.session_state["player"], st.session_state["player_version"] = get_player(st.session_state["username"])
\ No newline at end of file
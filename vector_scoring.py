@@ -0,0 +1,74 @@
+import time
+import numpy as np
+
+# Scores all players at once: predictions are a (players x matches) array of
+# team ids and the live results one array per column of the sheet, so the
+# statuses and points of everybody come out of a few array operations.
+# Gives the same numbers as calculate_points in scoring.py.
+
+
+def encode_live(schedule, now=None):
+    if now is None:
+        now = time.time()
+    return {
+        "winner": np.array([m.winner for m in schedule], dtype=np.int16),
+        "started": np.array([m.kickoff < now for m in schedule], dtype=bool),
+        "done": np.array([m.done for m in schedule], dtype=bool),
+        "goalsA": np.array([m.goals_a for m in schedule], dtype=np.float64),
+        "goalsB": np.array([m.goals_b for m in schedule], dtype=np.float64),
+    }
+
+def encode_players(players):
+    # players are PlayerRecords, their arrays are copied straight into numpy
+    players = list(players)
+    num_matches = len(players[0]) if players else 0
+
+    def stack(field, dtype):
+        data = b"".join(getattr(player, field).tobytes() for player in players)
+        return np.frombuffer(data, dtype=dtype).reshape(len(players), num_matches)
+
+    submitted = stack("match_submitted", np.uint8).astype(bool)
+    return {
+        "prediction": stack("prediction", np.uint16).astype(np.int16),
+        "submitted": submitted,
+        "goalsAp": np.where(submitted, stack("goals_a", np.int16), 0).astype(np.float64),
+        "goalsBp": np.where(submitted, stack("goals_b", np.int16), 0).astype(np.float64),
+    }
+
+def get_statuses(players, live):
+    prediction = players["prediction"]
+    not_voted = live["started"] & (prediction == 0)
+    correct = (live["winner"] != -1) & (prediction == live["winner"]) & ~not_voted
+    return not_voted, correct
+
+def bracket_weights(not_voted, bracket):
+    # bottom-up pass, a match is worth the sum of what its two feeding
+    # matches are worth, a first round slot or a match that started
+    # without a prediction counts 1
+    weights = np.zeros(not_voted.shape, dtype=np.float64)
+    for match_number in bracket.order:
+        next_l, next_r = bracket.children[match_number]
+        left = weights[:, next_l] if next_l >= 0 else 1.0
+        right = weights[:, next_r] if next_r >= 0 else 1.0
+        weights[:, match_number] = np.where(not_voted[:, match_number], 1.0, left + right)
+    return weights
+
+def match_points(players, live):
+    pred_a = players["goalsAp"]
+    pred_b = players["goalsBp"]
+    goals_a = live["goalsA"]
+    goals_b = live["goalsB"]
+    diff_p = pred_a - pred_b
+    diff = goals_a - goals_b
+    points = np.where(
+        (pred_a == goals_a) & (pred_b == goals_b), 5.0,
+        np.where(diff_p == diff, 4.0,
+                 np.where(((diff > 0) & (diff_p > 0)) | ((diff < 0) & (diff_p < 0)), 3.0, 0.0)),
+    )
+    return np.where(players["submitted"] & live["done"], points, 0.0)
+
+def score_players(players, live, bracket):
+    # returns (bracket points, match points), both players x matches
+    not_voted, correct = get_statuses(players, live)
+    weights = bracket_weights(not_voted, bracket)
+    return np.where(correct, weights, 0.0), match_points(players, live)
@@ -0,0 +1,94 @@
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+# Submits are handed to one background writer instead of each running its
+# own transaction in the Streamlit callback. The writer takes whatever came
+# in during the last interval seconds, writes it with one synced commit
+# (group commit) and only then resolves the futures, so a submit that
+# returns is on disk. At kickoff, when everybody submits within the same
+# minute, that is one fsync for many players instead of one each.
+
+
+class SubmitQueue:
+
+    def __init__(self, store, interval=0.005, max_batch=512, on_commit=None):
+        # on_commit(committed) runs on the writer thread after every batch,
+        # with (name, player, version) for each write that went through
+        self.store = store
+        self.interval = interval
+        self.max_batch = max_batch
+        self.on_commit = on_commit
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, name, change, default=None, expected_version=None):
+        # returns a Future for (player, version), it raises VersionConflict
+        # when expected_version was given and the player changed since
+        future = Future()
+        self._queue.put(((name, change, default, expected_version), future))
+        return future
+
+    def put(self, name, player, expected_version=None):
+        return self.submit(name, lambda _: player, player, expected_version)
+
+    def _take(self):
+        # the next batch and whether stop() was called, which puts None
+        item = self._queue.get()
+        batch = []
+        deadline = time.monotonic() + self.interval
+        while item is not None:
+            batch.append(item)
+            if len(batch) == self.max_batch:
+                return batch, False
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+        return batch, True
+
+    def _run(self):
+        while True:
+            batch, stopped = self._take()
+            self._write(batch)
+            if stopped:
+                return
+
+    def _write(self, batch):
+        if not batch:
+            return
+        writes = [write for write, _ in batch]
+        try:
+            results = self.store.write_batch(writes)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        committed = [(write[0],) + result for write, result in zip(writes, results) if not isinstance(result, Exception)]
+        if committed and self.on_commit is not None:
+            try:
+                self.on_commit(committed)
+            except Exception:
+                traceback.print_exc()
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="submit-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        # writes what is queued so far, then ends the writer thread
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()